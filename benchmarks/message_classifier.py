@@ -0,0 +1,56 @@
+"""
+Microbenchmark for the message fast path in ClusterBot.on_message: content normalization and the could_be_command
+check that decides whether a message needs a full context.
+
+Usage: python -m benchmarks.message_classifier <corpus> [prefix]
+
+The corpus is a recorded sample of message contents, one per line (newlines inside messages escaped as \\n).
+17 October 2026
+"""
+
+import sys
+import timeit
+
+from bot import CONTENT_TRANSLATION
+from helpers.utils import could_be_command
+
+# The most used commands and aliases, standing in for bot.all_commands
+
+COMMANDS = set(
+    "catch c pokemon p info i hint h select s pokedex d market m trade t shop buy balance bal release r releaseall "
+    "favorite fav nickname nick order daily vote quests event help start pick auction a evolve redeem".split()
+)
+
+
+def main():
+    corpus = [line.rstrip("\n").replace("\\n", "\n") for line in open(sys.argv[1], encoding="utf-8")]
+    prefix = sys.argv[2] if len(sys.argv) > 2 else "p!"
+    prefixes = [prefix, "<@716390085896962058> ", "<@!716390085896962058> "]
+    if prefix == "p!":
+        prefixes.insert(1, "P!")
+
+    def replace():
+        for x in corpus:
+            x.replace("—", "--").replace("'", "′").replace("‘", "′").replace("’", "′")
+
+    def translate():
+        for x in corpus:
+            x.translate(CONTENT_TRANSLATION)
+
+    normalized = [x.translate(CONTENT_TRANSLATION) for x in corpus]
+
+    def classify():
+        for x in normalized:
+            could_be_command(x, prefixes, COMMANDS)
+
+    print(f"{len(corpus):,} messages")
+    for name, func in (("replace x4", replace), ("translate", translate), ("could_be_command", classify)):
+        runs = timeit.repeat(func, number=10, repeat=5)
+        print(f"{name:>18}: {min(runs) / 10 / len(corpus) * 1e9:8.1f} ns/message")
+
+    candidates = sum(could_be_command(x, prefixes, COMMANDS) for x in normalized)
+    print(f"{len(corpus) - candidates:,} of {len(corpus):,} messages skip get_context")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,10 @@ DEFAULT_DISABLED_MESSAGE = (
     "Try again later and check the #status channel in the official server for more details."
 )
 
+# Applied to every message before it's parsed, so that phones' smart punctuation still works in commands
+
+CONTENT_TRANSLATION = str.maketrans({"—": "--", "'": "′", "‘": "′", "’": "′"})
+
 CONCURRENCY_LIMITED_COMMANDS = {
     "auction",
     "market",
@@ -118,11 +122,10 @@ class ClusterBot(commands.AutoShardedBot):
     # Other stuff
 
     async def send_dm(self, user, *args, **kwargs):
-        if not isinstance(user, discord.abc.Snowflake):
-            user = discord.Object(user)
+        return await self.get_cog("Bot").send_dm(user, *args, **kwargs)
 
-        dm = await self.create_dm(user)
-        return await dm.send(*args, **kwargs)
+    def queue_dm(self, user, *args, **kwargs):
+        return self.get_cog("Bot").queue_dm(user, *args, **kwargs)
 
     async def setup_hook(self):
         self.http_session = aiohttp.ClientSession()
@@ -138,8 +141,20 @@ class ClusterBot(commands.AutoShardedBot):
         self.log.info(f"Shard {shard_id} ready")
 
     async def on_message(self, message: discord.Message):
-        message.content = message.content.replace("—", "--").replace("'", "′").replace("‘", "′").replace("’", "′")
-        await self.process_commands(message)
+        # Each message is parsed at most once. Anything that isn't a valid command is passed on to the
+        # on_message_without_command listeners (spawning and XP), so they don't need to parse it again.
+
+        if message.author.bot:
+            return
+
+        message.content = message.content.translate(CONTENT_TRANSLATION)
+
+        if self.get_cog("Bot").could_be_command(message):
+            ctx = await self.get_context(message)
+            if ctx.valid:
+                return await self.invoke(ctx)
+
+        self.dispatch("message_without_command", message)
 
     async def invoke(self, ctx):
         if ctx.command is None:
@@ -159,4 +174,13 @@ class ClusterBot(commands.AutoShardedBot):
 
     async def close(self):
         self.log.info("shutting down")
+
+        # Cogs are unloaded by super().close(), and may go after the Mongo and Logging cogs they rely on, so buffered
+        # XP and queued DMs are dealt with first
+
+        if (spawning := self.get_cog("Spawning")) is not None:
+            await spawning.flush_xp_buffer()
+        if (bot_cog := self.get_cog("Bot")) is not None:
+            await bot_cog.drain_dms()
+
         await super().close()
@@ -32,7 +32,7 @@ class Administration(commands.Cog):
             {"_id": {"$in": [x.id for x in users]}},
             {"$set": {"suspended": True, "suspension_reason": reason}},
         )
-        await self.bot.redis.hdel("db:member", *[int(x.id) for x in users])
+        await self.bot.mongo.invalidate_member(*[int(x.id) for x in users])
         users_msg = ", ".join(f"**{x}**" for x in users)
         await ctx.send(f"Suspended {users_msg}.")
 
@@ -47,10 +47,75 @@ class Administration(commands.Cog):
             {"_id": {"$in": [x.id for x in users]}},
             {"$unset": {"suspended": 1, "suspension_reason": 1}},
         )
-        await self.bot.redis.hdel("db:member", *[int(x.id) for x in users])
+        await self.bot.mongo.invalidate_member(*[int(x.id) for x in users])
         users_msg = ", ".join(f"**{x}**" for x in users)
         await ctx.send(f"Unsuspended {users_msg}.")
 
+    @commands.check_any(
+        commands.is_owner(), commands.has_role(718006431231508481), commands.has_role(930346842586218607)
+    )
+    @admin.command(aliases=("cs",))
+    async def cachestats(self, ctx):
+        """View cache and cooldown store statistics for this cluster."""
+
+        stats = self.bot.mongo.member_cache_stats
+        total = sum(stats.values())
+
+        embed = self.bot.Embed(title=f"Member Cache ({self.bot.cluster_name})")
+        embed.add_field(name="Size", value=f"{len(self.bot.mongo.member_cache):,}")
+        for key, name in (("l1_hits", "L1 Hits"), ("l2_hits", "L2 Hits"), ("misses", "Misses")):
+            embed.add_field(name=name, value=f"{stats[key]:,} ({stats[key] / max(total, 1):.2%})")
+
+        for attr, name in (
+            ("cooldown_users", "User Cooldowns"),
+            ("cooldown_guilds", "Guild Cooldowns"),
+            ("guild_counter", "Guild Counters"),
+        ):
+            store = getattr(self.bot, attr)
+            embed.add_field(name=name, value=f"{len(store):,} keys ({store.memory_usage() / 1024:,.1f} KiB)")
+
+        spawning = self.bot.get_cog("Spawning")
+        embed.add_field(
+            name="Spawn Images",
+            value=f"{len(spawning.images):,} images ({spawning.images_size / 1024 / 1024:,.1f} MiB)",
+        )
+
+        bot_cog = self.bot.get_cog("Bot")
+        lines = [f"{bot_cog.dm_queue.qsize():,} waiting"]
+        lines += [f"{bot_cog.dm_stats[x]:,} {x}" for x in ("queued", "sent", "failed", "coalesced", "dropped")]
+        embed.add_field(name="DM Channels", value=f"{len(bot_cog.dm_channels):,}")
+        embed.add_field(name="DM Queue", value="\n".join(lines))
+
+        redis = self.bot.get_cog("Redis")
+        own, shared = await redis.fetch_backlog()
+        lines = [f"{own:,} waiting here, {shared:,} for any cluster"]
+        lines += [f"{redis.bus_stats[x]:,} {x}" for x in ("sent", "received", "failed", "malformed", "legacy")]
+        for kind, (count, total, worst) in redis.bus_latency.items():
+            lines.append(f"`{kind}`: {total / count * 1000:,.0f} ms avg, {worst * 1000:,.0f} ms max")
+        embed.add_field(name="Message Bus", value="\n".join(lines), inline=False)
+
+        await ctx.send(embed=embed)
+
+    @commands.check_any(
+        commands.is_owner(), commands.has_role(718006431231508481), commands.has_role(930346842586218607)
+    )
+    @admin.command(aliases=("ix",))
+    async def indexes(self, ctx):
+        """Create any missing database indexes and report undeclared and unused ones."""
+
+        report = await self.bot.mongo.ensure_indexes()
+
+        embed = self.bot.Embed(title="Database Indexes")
+        for collection, result in report.items():
+            lines = [
+                f"**Created:** {', '.join(x.document['name'] for x in result['missing']) or 'None'}",
+                f"**Undeclared:** {', '.join(result['extra']) or 'None'}",
+                f"**Unused:** {', '.join(result['unused']) or 'None'}",
+            ]
+            embed.add_field(name=collection, value="\n".join(lines), inline=False)
+
+        await ctx.send(embed=embed)
+
     @commands.check_any(
         commands.is_owner(), commands.has_role(718006431231508481), commands.has_role(930346842586218607)
     )
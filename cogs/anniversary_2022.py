@@ -236,7 +236,7 @@ class Anniversary(commands.Cog):
     # async def reset(self, ctx):
     #     """Reset your bingo board"""
 
-    #     member = await self.bot.mongo.fetch_member_info(ctx.author)
+    #     member = await ctx.fetch_member_info()
     #     if member.bingos_awarded < 12:
     #         return await ctx.send("You must have a full board to do this!")
 
@@ -246,7 +246,7 @@ class Anniversary(commands.Cog):
     #     if result is False:
     #         return await ctx.send("Aborted.")
 
-    #     member = await self.bot.mongo.fetch_member_info(ctx.author)
+    #     member = await ctx.fetch_member_info()
     #     if member.bingos_awarded < 12:
     #         return await ctx.send("You must have a full board to do this!")
 
@@ -269,7 +269,7 @@ class Anniversary(commands.Cog):
         if amt > 15:
             return await ctx.send("You can only open up to 15 anniversary boxes at once!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if member.anniversary_boxes < amt:
             return await ctx.send("You don't have enough boxes to do that!")
@@ -335,7 +335,7 @@ class Anniversary(commands.Cog):
         embed.set_author(icon_url=ctx.author.display_avatar.url, name=str(ctx.author))
         embed.add_field(name="Rewards Received", value="\n".join(text))
 
-        await self.bot.mongo.update_member(ctx.author, update)
+        await ctx.update_member(update)
         if len(added_pokemon) > 0:
             await self.bot.mongo.db.pokemon.insert_many(added_pokemon)
         await ctx.send(embed=embed)
@@ -377,7 +377,7 @@ class Anniversary(commands.Cog):
     #             incs[f"anniversary_quests.{i}.progress"] += 1
 
     #     if len(incs) > 0:
-    #         await self.bot.mongo.update_member(ctx.author, {"$inc": incs})
+    #         await ctx.update_member({"$inc": incs})
 
     #     await self.check_quests(ctx.author)
 
@@ -1,5 +1,6 @@
 import asyncio
 import contextlib
+import time
 from datetime import datetime, timedelta, timezone
 
 import discord
@@ -28,20 +29,76 @@ class Auctions(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.settling = set()
+        self.settle_semaphore = asyncio.Semaphore(getattr(self.bot.config, "AUCTION_SETTLE_CONCURRENCY", 8))
         self.check_auctions.start()
 
-    @tasks.loop(seconds=20)
+    # Auction end times are kept in one Redis sorted set per shard, so each auction is only ever picked up by the
+    # cluster that has its guild. Due auctions are claimed with a lease (see claim_due), so that if several
+    # processes poll the same shard, only one settles each auction, and one that dies mid-settlement is retried.
+
+    def schedule_key(self, shard_id):
+        return f"auction:ends:{shard_id}"
+
+    async def schedule_auction(self, guild, auction_id, ends):
+        ends = ends.replace(tzinfo=timezone.utc).timestamp()
+        await self.bot.redis.zadd(self.schedule_key(guild.shard_id), ends, auction_id)
+
+    @tasks.loop(seconds=1)
     async def check_auctions(self):
-        auctions = self.bot.mongo.Auction.find({"ends": {"$lt": datetime.utcnow()}})
-        async for auction in auctions:
-            try:
-                await self.end_auction(auction)
-            except Exception as e:
-                pass
+        now = time.time()
+        try:
+            claimed = await self.bot.get_cog("Redis").run_script(
+                "claim_due",
+                keys=[self.schedule_key(x) for x in self.bot.shard_ids],
+                args=[now, now + getattr(self.bot.config, "AUCTION_CLAIM_LEASE", 120), 100],
+            )
+        except Exception:
+            return self.bot.log.exception("Failed to claim due auctions")
+
+        for key, id in zip(claimed[::2], claimed[1::2]):
+            key, id = key.decode(), int(id)
+            if id not in self.settling:
+                self.settling.add(id)
+                self.bot.loop.create_task(self.settle_auction(key, id))
 
     @check_auctions.before_loop
     async def before_check_auctions(self):
         await self.bot.wait_until_ready()
+        await self.bot.get_cog("Redis").wait_until_ready()
+
+        # Schedule any auctions on this cluster's shards that aren't already, e.g. after the shard count changed
+
+        await self.bot.mongo.refresh_shard_ids("auction")
+        tr = self.bot.redis.multi_exec()
+        async for x in self.bot.mongo.db.auction.find(self.bot.mongo.local_shard_filter(), {"shard_id": 1, "ends": 1}):
+            ends = x["ends"].replace(tzinfo=timezone.utc).timestamp()
+            tr.zadd(self.schedule_key(x["shard_id"]), ends, x["_id"], exist=self.bot.redis.ZSET_IF_NOT_EXIST)
+        await tr.execute()
+
+    async def settle_auction(self, key, id):
+        try:
+            async with self.settle_semaphore:
+                auction = await self.bot.mongo.Auction.find_one({"id": id})
+                if auction is not None and auction.ends > datetime.utcnow():
+                    # Extended by a late bid
+                    ends = auction.ends.replace(tzinfo=timezone.utc).timestamp()
+                    return await self.bot.redis.zadd(key, ends, id)
+                if auction is not None and not await self.end_auction(auction):
+                    # Its guild isn't available here right now. It's claimed again once the lease runs out.
+                    return
+
+                tr = self.bot.redis.multi_exec()
+                tr.zrem(key, id)
+                tr.hdel("auction:attempts", id)
+                await tr.execute()
+        except Exception:
+            attempts = await self.bot.redis.hincrby("auction:attempts", id)
+            delay = min(5 * 2 ** (attempts - 1), getattr(self.bot.config, "AUCTION_MAX_RETRY_DELAY", 600))
+            await self.bot.redis.zadd(key, time.time() + delay, id)
+            self.bot.log.exception(f"Failed to end auction #{id} (attempt {attempts}), retrying in {delay}s")
+        finally:
+            self.settling.discard(id)
 
     async def try_get_member(self, guild, id):
         if user := self.bot.get_user(id):
@@ -53,8 +110,13 @@ class Auctions(commands.Cog):
         return FakeUser(id)
 
     async def end_auction(self, auction):
+        # Returns False if the auction's guild isn't available here, leaving it scheduled. Every step can safely be
+        # repeated, so a settlement that failed partway is finished by the retry: the pokemon keeps its _id and is
+        # only inserted once, the host's payment is a single write that records the auction in paid_auctions so it
+        # can't apply twice, and only the call that deletes the auction announces the result.
+
         if (auction_guild := self.bot.get_guild(auction.guild_id)) is None:
-            return
+            return False
 
         guild = await self.bot.mongo.fetch_guild(auction_guild)
 
@@ -65,6 +127,33 @@ class Auctions(commands.Cog):
         host = await self.try_get_member(auction_guild, auction.user_id)
         bidder = await self.try_get_member(auction_guild, auction.bidder_id)
 
+        # The idx is only reserved if the pokemon hasn't been inserted by an earlier attempt
+
+        if await self.bot.mongo.db.pokemon.count_documents({"_id": auction.pokemon.id}, limit=1) == 0:
+            with contextlib.suppress(pymongo.errors.DuplicateKeyError):
+                await self.bot.mongo.db.pokemon.insert_one(
+                    {
+                        **auction.pokemon.to_mongo(),
+                        "owner_id": auction.bidder_id,
+                        "owned_by": "user",
+                        "idx": await self.bot.mongo.fetch_next_idx(bidder),
+                    }
+                )
+
+        await self.bot.mongo.db.member.update_one(
+            {"_id": host.id, "paid_auctions": {"$ne": auction.id}},
+            {"$inc": {"balance": auction.current_bid}, "$addToSet": {"paid_auctions": auction.id}},
+        )
+        await self.bot.mongo.invalidate_member(host.id)
+
+        result = await self.bot.mongo.db.auction.delete_one({"_id": auction.id})
+        if result.deleted_count == 0:
+            return True
+
+        # Once the auction is gone nothing can pay for it again
+
+        await self.bot.mongo.db.member.update_one({"_id": host.id}, {"$pull": {"paid_auctions": auction.id}})
+
         embed = self.make_base_embed(host, auction.pokemon, auction.id)
         embed.title = f"[SOLD] {embed.title}"
         auction_info = (
@@ -78,33 +167,13 @@ class Auctions(commands.Cog):
         if auction_channel is not None:
             self.bot.loop.create_task(auction_channel.send(embed=embed))
 
-        # ok, bid
-
-        try:
-            await self.bot.mongo.db.pokemon.insert_one(
-                {
-                    **auction.pokemon.to_mongo(),
-                    "owner_id": auction.bidder_id,
-                    "owned_by": "user",
-                    "idx": await self.bot.mongo.fetch_next_idx(bidder),
-                }
-            )
-        except pymongo.errors.DuplicateKeyError:
-            return
-        finally:
-            await self.bot.mongo.db.auction.delete_one({"_id": auction.id})
-
-        await self.bot.mongo.update_member(host, {"$inc": {"balance": auction.current_bid}})
-
-        self.bot.loop.create_task(
-            host.send(
-                f"The auction for your **{auction.pokemon.iv_percentage:.2%} {auction.pokemon.species}** ended with a highest bid of **{auction.current_bid:,}** Pokécoins (Auction #{auction.id})."
-            )
+        self.bot.queue_dm(
+            host,
+            f"The auction for your **{auction.pokemon.iv_percentage:.2%} {auction.pokemon.species}** ended with a highest bid of **{auction.current_bid:,}** Pokécoins (Auction #{auction.id}).",
         )
-        self.bot.loop.create_task(
-            bidder.send(
-                f"You won the auction for the **{auction.pokemon.iv_percentage:.2%} {auction.pokemon.species}** with a bid of **{auction.current_bid:,}** Pokécoins (Auction #{auction.id})."
-            )
+        self.bot.queue_dm(
+            bidder,
+            f"You won the auction for the **{auction.pokemon.iv_percentage:.2%} {auction.pokemon.species}** with a bid of **{auction.current_bid:,}** Pokécoins (Auction #{auction.id}).",
         )
 
         if auction.current_bid > 0:
@@ -121,6 +190,8 @@ class Auctions(commands.Cog):
             except:
                 pass
 
+        return True
+
     def make_base_embed(self, author, pokemon, auction_id):
         embed = self.bot.Embed(
             title=f"Auction #{auction_id} • {pokemon:l}",
@@ -204,7 +275,7 @@ class Auctions(commands.Cog):
                 f"Auctions have not been set up in this server. Have a server administrator do `{ctx.prefix}auction channel #channel`."
             )
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if member.selected_id == pokemon.id:
             return await ctx.send(f"{pokemon.idx}: You can't auction your selected pokémon!")
@@ -256,7 +327,7 @@ class Auctions(commands.Cog):
         await self.bot.mongo.db.auction.insert_one(
             {
                 "_id": counter["next"],
-                "guild_id": ctx.guild.id,
+                **self.bot.mongo.shard_fields(ctx.guild.id),
                 "pokemon": pokemon.to_mongo(),
                 "user_id": ctx.author.id,
                 "current_bid": starting_bid - bid_increment,
@@ -266,6 +337,7 @@ class Auctions(commands.Cog):
             }
         )
         await self.bot.mongo.db.pokemon.delete_one({"_id": pokemon.id})
+        await self.schedule_auction(ctx.guild, counter["next"], ends)
 
         await auction_channel.send(embed=embed)
         await ctx.send(f"Auctioning your **{pokemon.iv_percentage:.2%} {pokemon.species} No. {pokemon.idx}**.")
@@ -335,7 +407,7 @@ class Auctions(commands.Cog):
             )
 
         guild = await self.bot.mongo.fetch_guild(ctx.guild)
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         if member.balance < bid:
             return await ctx.send("You don't have enough Pokécoins for that!")
 
@@ -364,7 +436,7 @@ class Auctions(commands.Cog):
         if auction.ends < datetime.utcnow():
             return await ctx.send("This auction has ended.")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         if member.balance < bid:
             return await ctx.send("You don't have enough Pokécoins for that!")
 
@@ -403,21 +475,22 @@ class Auctions(commands.Cog):
         if r.modified_count == 0:
             return await ctx.send("That auction has already ended.")
 
+        if "ends" in update["$set"]:
+            await self.schedule_auction(ctx.guild, auction.id, update["$set"]["ends"])
+
         auction_channel = ctx.guild.get_channel(guild.auction_channel)
         if auction_channel is not None:
             self.bot.loop.create_task(auction_channel.send(embed=embed))
 
         # ok, bid
 
-        await self.bot.mongo.update_member(ctx.author, {"$inc": {"balance": -bid}})
+        await ctx.update_member({"$inc": {"balance": -bid}})
 
         if auction.bidder_id is not None:
             await self.bot.mongo.update_member(auction.bidder_id, {"$inc": {"balance": auction.current_bid}})
-            self.bot.loop.create_task(
-                self.bot.send_dm(
-                    auction.bidder_id,
-                    f"You have been outbid on the **{auction.pokemon.iv_percentage:.2%} {auction.pokemon.species}** (Auction #{auction.id}). New bid: {bid} pokécoins.",
-                )
+            self.bot.queue_dm(
+                auction.bidder_id,
+                f"You have been outbid on the **{auction.pokemon.iv_percentage:.2%} {auction.pokemon.species}** (Auction #{auction.id}). New bid: {bid} pokécoins.",
             )
         await ctx.send(
             f"You bid **{bid:,} Pokécoins** on the **{auction.pokemon.iv_percentage:.2%} {auction.pokemon.species}** (Auction #{auction.id})."
@@ -526,16 +599,16 @@ class Auctions(commands.Cog):
                 )
 
         count = await self.bot.mongo.fetch_auction_count(ctx.guild, aggregations)
-        pokemon = self.bot.mongo.fetch_auction_list(ctx.guild, aggregations)
 
         pages = pagination.ContinuablePages(
-            pagination.AsyncListPageSource(
-                pokemon,
+            pagination.make_list_page_source(
+                lambda aggs: self.bot.mongo.fetch_auction_list(ctx.guild, aggs),
+                aggregations,
+                count,
                 title=f"Auctions in {ctx.guild.name}",
                 prepare_page=prepare_page,
                 format_item=format_item,
                 per_page=15,
-                count=count,
             )
         )
         pages.current_page = flags["page"] - 1
@@ -1,12 +1,13 @@
 import asyncio
+import json
 import math
-import pickle
+import time
 import typing
 from enum import Enum
 from urllib.parse import urlencode, urljoin
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from helpers import checks, constants, converters, pagination
 
 import data.constants
@@ -88,19 +89,7 @@ class Trainer:
 
         # Send request
 
-        await self.bot.redis.rpush(
-            "move_request",
-            pickle.dumps(
-                {
-                    "cluster_idx": self.bot.cluster_idx,
-                    "user_id": self.user.id,
-                    "species_id": self.selected.species.id,
-                    "actions": actions,
-                }
-            ),
-        )
-
-        uid, action = await self.bot.wait_for("move_decide", check=lambda u, a: u == self.user.id)
+        action = await self.bot.get_cog("Battling").prompt_move(self.user.id, self.selected.species.id, actions)
 
         await self.user.send(f"You selected **{action['text']}**.\n\n**Back to battle:** {message.jump_url}")
 
@@ -119,6 +108,8 @@ class Battle:
         self.ctx = ctx
         self.bot = ctx.bot
         self.manager = manager
+        self.decision_times = []
+        self.turn_times = []
 
     async def send_selection(self, ctx):
         embed = self.bot.Embed(title="Choose your party")
@@ -155,11 +146,24 @@ class Battle:
         self.stage = Stage.END
         del self.manager[self.trainers[0].user]
 
+    async def get_action(self, trainer, message):
+        start = time.perf_counter()
+        action = await trainer.get_action(message)
+        self.decision_times.append(time.perf_counter() - start)
+        return action
+
     async def run_step(self, message):
         if self.stage != Stage.PROGRESS:
             return
 
-        actions = await asyncio.gather(self.trainers[0].get_action(message), self.trainers[1].get_action(message))
+        start = time.perf_counter()
+        try:
+            await self.run_turn(message)
+        finally:
+            self.turn_times.append(time.perf_counter() - start)
+
+    async def run_turn(self, message):
+        actions = await asyncio.gather(*(self.get_action(x, message) for x in self.trainers))
 
         if actions[0]["type"] == "pass" and actions[1]["type"] == "pass":
             self.passed_turns += 1
@@ -328,6 +332,21 @@ class Battle:
             await self.run_step(message)
         await self.send_battle()
 
+        def summarize(times):
+            if len(times) == 0:
+                return None
+            return {"avg_ms": round(sum(times) / len(times) * 1000), "max_ms": round(max(times) * 1000)}
+
+        self.bot.log.info(
+            "Battle ended",
+            extra={
+                "users": [x.user.id for x in self.trainers],
+                "turns": len(self.turn_times),
+                "decision_time": summarize(self.decision_times),
+                "turn_time": summarize(self.turn_times),
+            },
+        )
+
 
 class BattleManager:
     def __init__(self):
@@ -369,49 +388,43 @@ class Battling(commands.Cog):
         if not hasattr(self.bot, "battles"):
             self.bot.battles = BattleManager()
 
-        self.process_move_decisions.start()
-        if self.bot.cluster_idx == 0:
-            self.process_move_requests.start()
-
     def reload_battling(self):
         for battle in self.bot.battles.battles.values():
             battle.stage = Stage.END
         self.bot.battles = BattleManager()
 
-    @tasks.loop(seconds=0.1)
-    async def process_move_requests(self):
-        with await self.bot.redis as r:
-            req = await r.blpop("move_request")
-            data = pickle.loads(req[1])
-            self.bot.dispatch(
-                "move_request",
-                data["cluster_idx"],
-                data["user_id"],
-                data["species_id"],
-                data["actions"],
-            )
+    # Move prompts are sent and waited on by the cluster running the battle. Reactions and commands in DMs only reach
+    # the cluster with shard 0, so whichever cluster receives one looks up the user's open prompt in Redis and passes
+    # the move on to the cluster that sent it.
 
-    @process_move_requests.before_loop
-    async def before_process_move_requests(self):
-        await self.bot.wait_until_ready()
-
-    @tasks.loop(seconds=0.1)
-    async def process_move_decisions(self):
-        with await self.bot.redis as r:
-            req = await r.blpop(f"move_decide:{self.bot.cluster_idx}")
-            data = pickle.loads(req[1])
-            self.bot.dispatch(
-                "move_decide",
-                data["user_id"],
-                data["action"],
-            )
+    async def forward_move(self, user_id, move, message_id=None):
+        # Reactions carry the prompt's message ID and are only passed on if they're one of its moves. Moves given by
+        # name are checked by the prompt itself.
+
+        prompt = await self.bot.redis.get(f"battle:prompt:{user_id}", encoding="utf-8")
+        if prompt is None:
+            return False
 
-    @process_move_decisions.before_loop
-    async def before_process_move_decisions(self):
-        await self.bot.wait_until_ready()
+        prompt = json.loads(prompt)
+        cluster_idx = prompt["cluster"]
+        if message_id is not None and (message_id != prompt["message"] or move not in prompt["emoji"]):
+            return False
+
+        if cluster_idx == self.bot.cluster_idx:
+            self.bot.dispatch("battle_move", user_id, move)
+        else:
+            await self.bot.get_cog("Redis").send_message("battle_move", cluster_idx, user_id=user_id, move=move)
+        return True
+
+    async def handle_battle_move(self, user_id, move):
+        self.bot.dispatch("battle_move", user_id, move)
 
     @commands.Cog.listener()
-    async def on_move_request(self, cluster_idx, user_id, species_id, actions):
+    async def on_raw_reaction_add(self, payload):
+        if payload.guild_id is None and payload.user_id != self.bot.user.id:
+            await self.forward_move(payload.user_id, payload.emoji.name, payload.message_id)
+
+    async def prompt_move(self, user_id, species_id, actions):
         species = self.bot.data.species_by_number(species_id)
 
         embed = self.bot.Embed(title=f"What should {species} do?")
@@ -419,7 +432,11 @@ class Battling(commands.Cog):
         embed.description = "\n".join(
             f"{k} **{v['text']}** • `@Pokétwo battle move {v['command']}`" for k, v in actions.items()
         )
-        msg = await self.bot.send_dm(user_id, embed=embed)
+        try:
+            msg = await self.bot.send_dm(user_id, embed=embed)
+        except discord.HTTPException:
+            # e.g. the user has DMs closed
+            return {"type": "pass", "text": "nothing. Passing turn..."}
 
         async def add_reactions():
             for k in actions:
@@ -427,35 +444,30 @@ class Battling(commands.Cog):
 
         self.bot.loop.create_task(add_reactions())
 
-        def check(payload):
-            return payload.message_id == msg.id and payload.user_id == user_id and payload.emoji.name in actions
+        key = f"battle:prompt:{user_id}"
+        prompt = {"cluster": self.bot.cluster_idx, "message": msg.id, "emoji": list(actions)}
+        await self.bot.redis.set(key, json.dumps(prompt), expire=40)
 
-        async def listen_for_reactions():
-            try:
-                payload = await self.bot.wait_for("raw_reaction_add", timeout=35, check=check)
-                action = actions[payload.emoji.name]
-                self.bot.dispatch("battle_move", user_id, action["command"])
-            except asyncio.TimeoutError:
-                pass
-
-        self.bot.loop.create_task(listen_for_reactions())
+        # A move is either a reaction on the prompt or the name given to the battle move command
 
         try:
             while True:
-                _, move_name = await self.bot.wait_for("battle_move", timeout=35, check=lambda u, m: u == user_id)
+                _, move = await self.bot.wait_for("battle_move", timeout=35, check=lambda u, m: u == user_id)
+                if move in actions:
+                    action = actions[move]
+                    break
                 try:
-                    action = next(x for x in actions.values() if x["command"].lower() == move_name.lower())
+                    action = next(x for x in actions.values() if x["command"].lower() == move.lower())
                 except StopIteration:
-                    await self.bot.send_dm(user_id, "That's not a valid move here!")
+                    self.bot.queue_dm(user_id, "That's not a valid move here!")
                 else:
                     break
         except asyncio.TimeoutError:
             action = {"type": "pass", "text": "nothing. Passing turn..."}
+        finally:
+            await self.bot.redis.delete(key)
 
-        await self.bot.redis.rpush(
-            f"move_decide:{cluster_idx}",
-            pickle.dumps({"user_id": user_id, "action": action}),
-        )
+        return action
 
     @checks.has_started()
     @in_battle(False)
@@ -550,12 +562,12 @@ class Battling(commands.Cog):
             await self.bot.battles[ctx.author].send_selection(ctx)
 
     @checks.has_started()
-    @in_battle(True)
     @battle.command(aliases=("m",))
     async def move(self, ctx, *, move):
         """Move in a battle."""
 
-        self.bot.dispatch("battle_move", ctx.author, move)
+        if not await self.forward_move(ctx.author.id, move):
+            await ctx.send("You don't have a move to choose right now!")
 
     @checks.has_started()
     @commands.command(aliases=("mv",), rest_is_raw=True)
@@ -595,7 +607,7 @@ class Battling(commands.Cog):
         if move is None:
             return await ctx.send("Couldn't find that move!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         pokemon = await self.bot.mongo.fetch_pokemon(ctx.author, member.selected_id)
         if pokemon is None:
             return await ctx.send("You must have a pokémon selected!")
@@ -723,10 +735,6 @@ class Battling(commands.Cog):
         self.bot.battles[ctx.author].end()
         await ctx.send("The battle has been canceled.")
 
-    def cog_unload(self):
-        if self.bot.cluster_idx == 0:
-            self.process_move_requests.cancel()
-
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Battling(bot))
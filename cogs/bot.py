@@ -1,15 +1,21 @@
-import pickle
+import asyncio
+import contextlib
 import random
 import sys
+import time
 import traceback
-from datetime import datetime, timedelta
+from collections import Counter as StatsCounter
+from datetime import datetime, timedelta, timezone
 from typing import Counter
 
 import aiohttp
 import discord
 from discord.channel import TextChannel
 from discord.ext import commands, flags, tasks
+from discord.utils import MISSING
+from expiringdict import ExpiringDict
 from helpers import checks, constants
+from helpers.utils import could_be_command
 from helpers.views import ConfirmTermsOfServiceView
 
 GENERAL_CHANNEL_NAMES = {"welcome", "general", "lounge", "chat", "talk", "main"}
@@ -28,7 +34,10 @@ class Bot(commands.Cog):
         self.dbl_session = aiohttp.ClientSession(headers=headers)
 
         if not hasattr(self.bot, "prefixes"):
-            self.bot.prefixes = {}
+            self.bot.prefixes = ExpiringDict(
+                max_len=getattr(self.bot.config, "PREFIX_CACHE_SIZE", 100000),
+                max_age_seconds=getattr(self.bot.config, "PREFIX_CACHE_TTL", 86400),
+            )
 
         self.post_count.start()
 
@@ -37,7 +46,21 @@ class Bot(commands.Cog):
             self.remind_votes.start()
 
         self.cd = commands.CooldownMapping.from_cooldown(5, 3, commands.BucketType.user)
-        self.bot.loop.create_task(self.process_dms())
+
+        # DMs that nobody waits on are queued and sent by a few workers at a steady rate, rather than each getting
+        # its own task. DM channel IDs never change, so they're cached here and in Redis to skip create_dm. The Redis
+        # keys are per user and expire, so users who aren't DMed again don't stay there forever.
+
+        self.dm_channels = ExpiringDict(
+            max_len=getattr(self.bot.config, "DM_CHANNEL_CACHE_SIZE", 100000),
+            max_age_seconds=getattr(self.bot.config, "DM_CHANNEL_CACHE_TTL", 86400),
+        )
+        self.dm_queue = asyncio.Queue(maxsize=getattr(self.bot.config, "DM_QUEUE_SIZE", 10000))
+        self.dm_pending = set()
+        self.dm_stats = StatsCounter()
+        self.dm_workers = [
+            self.bot.loop.create_task(self.dm_worker()) for _ in range(getattr(self.bot.config, "DM_WORKERS", 4))
+        ]
 
     async def bot_check(self, ctx):
         if ctx.invoked_with.lower() == "help":
@@ -49,13 +72,76 @@ class Bot(commands.Cog):
 
         return True
 
-    async def process_dms(self):
+    async def handle_send_dm(self, user_id, content):
+        self.queue_dm(user_id, content)
+
+    async def fetch_dm_channel(self, user_id):
+        channel_id = self.dm_channels.get(user_id)
+        if channel_id is None:
+            channel_id = await self.bot.redis.get(f"dm_channel:{user_id}")
+            if channel_id is None:
+                channel = await self.bot.create_dm(discord.Object(user_id))
+                channel_id = channel.id
+                await self.bot.redis.set(
+                    f"dm_channel:{user_id}",
+                    channel_id,
+                    expire=getattr(self.bot.config, "DM_CHANNEL_REDIS_TTL", 7 * 86400),
+                )
+            channel_id = int(channel_id)
+            self.dm_channels[user_id] = channel_id
+        return self.bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+
+    async def send_dm(self, user, *args, **kwargs):
+        if isinstance(user, discord.abc.Snowflake):
+            user = user.id
+        channel = await self.fetch_dm_channel(user)
+        return await channel.send(*args, **kwargs)
+
+    def queue_dm(self, user, content=None, **kwargs):
+        # Returns whether the DM was queued. Identical plain-text DMs to the same user that are still waiting are
+        # coalesced, and DMs are dropped rather than piling up if the queue is full.
+
+        if isinstance(user, discord.abc.Snowflake):
+            user = user.id
+
+        key = (user, content) if len(kwargs) == 0 else None
+        if key is not None and key in self.dm_pending:
+            self.dm_stats["coalesced"] += 1
+            return False
+
+        try:
+            self.dm_queue.put_nowait((user, content, kwargs, key))
+        except asyncio.QueueFull:
+            self.dm_stats["dropped"] += 1
+            return False
+
+        if key is not None:
+            self.dm_pending.add(key)
+        self.dm_stats["queued"] += 1
+        return True
+
+    async def dm_worker(self):
+        # Each DM channel has its own rate limit bucket, so the limit that matters is the global one. Workers
+        # share DM_RATE evenly by pausing between sends. Rate limited requests are retried by discord.py itself.
+
         await self.bot.wait_until_ready()
-        with await self.bot.redis as r:
-            while True:
-                req = await r.blpop("send_dm")
-                uid, content = pickle.loads(req[1])
-                self.bot.loop.create_task(self.bot.send_dm(uid, content))
+        interval = len(self.dm_workers) / getattr(self.bot.config, "DM_RATE", 10)
+
+        while True:
+            user, content, kwargs, key = await self.dm_queue.get()
+            self.dm_pending.discard(key)
+            try:
+                await self.send_dm(user, content, **kwargs)
+                self.dm_stats["sent"] += 1
+            except discord.HTTPException:
+                self.dm_stats["failed"] += 1
+            except Exception:
+                self.dm_stats["failed"] += 1
+                self.bot.log.exception(f"Failed to send DM to {user}")
+            finally:
+                self.dm_queue.task_done()
+
+            await asyncio.sleep(interval)
 
     @commands.Cog.listener()
     async def on_message_edit(self, before, after):
@@ -181,22 +267,36 @@ class Bot(commands.Cog):
         )
         await channel.send(embed=embed)
 
-    async def determine_prefix(self, guild):
-        if guild:
-            if guild.id not in self.bot.prefixes:
-                data = await self.bot.mongo.Guild.find_one({"id": guild.id})
-                if data is None:
-                    data = self.bot.mongo.Guild(id=guild.id)
-                    await data.commit()
+    @commands.Cog.listener()
+    async def on_guilds_loaded(self, guilds):
+        # The Mongo cog preloads each shard's guild settings, so every prefix on the shard is known up front. Guilds
+        # without a custom prefix (including those with no document at all) are cached as None, so they don't each
+        # cost a query on their first message.
+
+        for id, g in guilds.items():
+            self.bot.prefixes.setdefault(id, None if g is None else g.prefix)
+
+    def invalidate_prefix(self, guild_id, prefix=MISSING):
+        if prefix is MISSING:
+            self.bot.prefixes.pop(guild_id, None)
+        else:
+            self.bot.prefixes[guild_id] = prefix
 
-                self.bot.prefixes[guild.id] = data.prefix
+    def cached_prefixes(self, guild):
+        # The prefixes for a guild if they're known without a query, otherwise None
 
-            if self.bot.prefixes[guild.id] is not None:
-                return [
-                    self.bot.prefixes[guild.id],
-                    self.bot.user.mention + " ",
-                    self.bot.user.mention[:2] + "!" + self.bot.user.mention[2:] + " ",
-                ]
+        prefix = None
+        if guild:
+            prefix = self.bot.prefixes.get(guild.id, MISSING)
+            if prefix is MISSING:
+                return None
+
+        if prefix is not None:
+            return [
+                prefix,
+                self.bot.user.mention + " ",
+                self.bot.user.mention[:2] + "!" + self.bot.user.mention[2:] + " ",
+            ]
 
         return [
             "p!",
@@ -205,6 +305,22 @@ class Bot(commands.Cog):
             self.bot.user.mention[:2] + "!" + self.bot.user.mention[2:] + " ",
         ]
 
+    async def determine_prefix(self, guild):
+        prefixes = self.cached_prefixes(guild)
+        if prefixes is None:
+            self.bot.prefixes[guild.id] = (await self.bot.mongo.fetch_guild(guild)).prefix
+            prefixes = self.cached_prefixes(guild)
+        return prefixes
+
+    def could_be_command(self, message):
+        # Cheap check run before building a context. Messages in guilds whose prefix isn't cached yet always get
+        # the full treatment.
+
+        prefixes = self.cached_prefixes(message.guild)
+        if prefixes is None:
+            return True
+        return could_be_command(message.content, prefixes, self.bot.all_commands)
+
     @commands.command()
     async def invite(self, ctx):
         """View the invite link for the bot."""
@@ -253,30 +369,74 @@ class Bot(commands.Cog):
     async def before_post_dbl(self):
         await self.bot.wait_until_ready()
 
+    # Vote reminders are scheduled in the vote_reminders sorted set, scored by when the vote timer refreshes. Votes
+    # are recorded outside the bot, so new ones are picked up from the member collection incrementally: only
+    # members who voted since the last sync (less a margin for late writes) are read.
+
+    async def sync_vote_reminders(self):
+        synced = float(await self.bot.redis.get("vote_reminders:synced") or 0)
+        since = datetime.utcfromtimestamp(max(synced - 60, 0))
+
+        tr = self.bot.redis.multi_exec()
+        async for x in self.bot.mongo.db.member.find(
+            {"need_vote_reminder": True, "last_voted": {"$gt": since}}, {"last_voted": 1}
+        ):
+            voted = x["last_voted"].replace(tzinfo=timezone.utc).timestamp()
+            synced = max(synced, voted)
+            tr.zadd("vote_reminders", voted + 12 * 60 * 60, x["_id"])
+        tr.set("vote_reminders:synced", synced)
+        await tr.execute()
+
+    async def send_vote_reminder(self, id):
+        # Returns whether a DM went out. The flag is only cleared if the vote it was for is still the latest one;
+        # a member who voted again in the meantime is rescheduled instead.
+
+        x = await self.bot.mongo.db.member.find_one({"_id": id}, {"need_vote_reminder": 1, "last_voted": 1})
+        if x is None or not x.get("need_vote_reminder"):
+            await self.bot.redis.zrem("vote_reminders", id)
+            return False
+
+        due = x["last_voted"].replace(tzinfo=timezone.utc).timestamp() + 12 * 60 * 60
+        if due > time.time():
+            await self.bot.redis.zadd("vote_reminders", due, id)
+            return False
+
+        with contextlib.suppress(discord.HTTPException):
+            await self.bot.send_dm(
+                id,
+                "Your vote timer has refreshed. You can now vote again! https://top.gg/bot/716390085896962058/vote",
+            )
+
+        await self.bot.mongo.db.member.update_one(
+            {"_id": id, "need_vote_reminder": True, "last_voted": x["last_voted"]},
+            {"$set": {"need_vote_reminder": False}},
+        )
+        await self.bot.redis.zrem("vote_reminders", id)
+        await self.bot.mongo.invalidate_member(id)
+        return True
+
     @tasks.loop(seconds=15)
     async def remind_votes(self):
-        query = {
-            "need_vote_reminder": True,
-            "last_voted": {"$lt": datetime.utcnow() - timedelta(hours=12)},
-        }
+        await self.sync_vote_reminders()
 
-        ids = set()
+        batch_size = getattr(self.bot.config, "VOTE_REMINDER_BATCH_SIZE", 50)
+        rate = getattr(self.bot.config, "VOTE_REMINDER_DM_RATE", 5)
 
-        async for x in self.bot.mongo.db.member.find(query, {"_id": 1}, no_cursor_timeout=True):
-            try:
-                ids.add(x["_id"])
-                self.bot.loop.create_task(
-                    self.bot.send_dm(
-                        x["_id"],
-                        "Your vote timer has refreshed. You can now vote again! https://top.gg/bot/716390085896962058/vote",
-                    )
-                )
-            except:
-                pass
+        while True:
+            now = time.time()
+            claimed = await self.bot.get_cog("Redis").run_script(
+                "claim_due", keys=["vote_reminders"], args=[now, now + batch_size / rate + 60, batch_size]
+            )
+            if len(claimed) == 0:
+                break
 
-        await self.bot.mongo.db.member.update_many(query, {"$set": {"need_vote_reminder": False}})
-        if len(ids) > 0:
-            await self.bot.redis.hdel("db:member", *[int(x) for x in ids])
+            for id in claimed[1::2]:
+                try:
+                    if await self.send_vote_reminder(int(id)):
+                        await asyncio.sleep(1 / rate)
+                except Exception:
+                    # Left claimed, so it's retried once the lease runs out
+                    self.bot.log.exception(f"Failed to send vote reminder to {int(id)}")
 
     @remind_votes.before_loop
     async def before_remind_votes(self):
@@ -359,7 +519,7 @@ class Bot(commands.Cog):
     async def pick(self, ctx, *, name: str):
         """Pick a starter pokémon to get started."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if member is not None:
             return await ctx.send(
@@ -413,7 +573,7 @@ class Bot(commands.Cog):
                 "next_idx": 2,
             }
         )
-        await self.bot.redis.hdel("db:member", ctx.author.id)
+        await self.bot.mongo.invalidate_member(ctx.author.id)
 
         await ctx.send(
             f"Congratulations on entering the world of pokémon! {species} is your first pokémon. Type `{ctx.prefix}info` to view it!"
@@ -424,7 +584,7 @@ class Bot(commands.Cog):
     async def profile(self, ctx):
         """View your profile."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         embed = self.bot.Embed(title="Trainer Profile")
         embed.set_author(name=str(ctx.author), icon_url=ctx.author.display_avatar.url)
@@ -459,8 +619,32 @@ class Bot(commands.Cog):
 
         await ctx.send(embed=embed)
 
-    def cog_unload(self):
+    async def drain_dms(self):
+        # Gives the workers a few seconds to send what's queued, then stops them and logs whatever is left. Called by
+        # ClusterBot.close while the Logging cog is still loaded, and again on unload for reloads.
+
+        if self.dm_queue.qsize() > 0:
+            try:
+                await asyncio.wait_for(self.dm_queue.join(), getattr(self.bot.config, "DM_DRAIN_TIMEOUT", 5))
+            except asyncio.TimeoutError:
+                pass
+        for task in self.dm_workers:
+            task.cancel()
+
+        if (dropped := self.dm_queue.qsize()) > 0:
+            self.dm_stats["dropped"] += dropped
+            self.bot.log.warning(f"Dropping {dropped} queued DMs on shutdown")
+            while not self.dm_queue.empty():
+                self.dm_queue.get_nowait()
+                self.dm_queue.task_done()
+            self.dm_pending.clear()
+
+    async def cog_unload(self):
         self.post_count.cancel()
+        if self.bot.get_cog("Logging") is not None:
+            await self.drain_dms()
+        for task in self.dm_workers:
+            task.cancel()
 
         if self.bot.cluster_idx == 0 and self.bot.config.DBL_TOKEN is not None:
             self.post_dbl.cancel()
@@ -53,10 +53,10 @@ class Christmas(commands.Cog):
     # @commands.Cog.listener()
     # async def on_catch(self, ctx, species):
     #     if "Ice" in species.types and random.random() < 0.5:
-    #         await self.bot.mongo.update_member(ctx.author, {"$inc": {"christmas_boxes_nice": 1}})
+    #         await ctx.update_member({"$inc": {"christmas_boxes_nice": 1}})
     #         await ctx.send(f"The Pokémon dropped a 🎁 **Nice Box**! Use `{ctx.prefix}event` to view more info.")
     #     if "Rock" in species.types and random.random() < 0.35:
-    #         await self.bot.mongo.update_member(ctx.author, {"$inc": {"christmas_boxes_naughty": 1}})
+    #         await ctx.update_member({"$inc": {"christmas_boxes_naughty": 1}})
     #         await ctx.send(f"The Pokémon dropped a 🎁 **Naughty Box**! Use `{ctx.prefix}event` to view more info.")
 
     @checks.has_started()
@@ -64,7 +64,7 @@ class Christmas(commands.Cog):
     async def christmas(self, ctx):
         """View Christmas event information."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         embed = self.bot.Embed(color=random.choice([0x9ECFFC, 0xDE2E43, 0x79B15A]))
         embed.title = f"Christmas 2021"
@@ -105,7 +105,7 @@ class Christmas(commands.Cog):
     async def open(self, ctx, box_type):
         """Open a box"""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         box_type = box_type.lower()
         if box_type not in {"nice", "naughty"}:
@@ -116,8 +116,7 @@ class Christmas(commands.Cog):
         if box_type == "naughty" and member.christmas_boxes_naughty <= 0:
             return await ctx.send("You don't have enough boxes to do that!")
 
-        await self.bot.mongo.update_member(
-            ctx.author,
+        await ctx.update_member(
             {"$inc": {f"christmas_boxes_{box_type}": -1, f"christmas_boxes_{box_type}_opened": 1}},
         )
 
@@ -130,16 +129,16 @@ class Christmas(commands.Cog):
 
         if reward == "shards":
             shards = max(round(random.normalvariate(25, 10)), 2)
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"premium_balance": shards}})
+            await ctx.update_member({"$inc": {"premium_balance": shards}})
             text = f"{shards} Shards"
 
         elif reward == "pokecoins":
             pokecoins = max(round(random.normalvariate(1000, 500)), 800)
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"balance": pokecoins}})
+            await ctx.update_member({"$inc": {"balance": pokecoins}})
             text = f"{pokecoins} Pokécoins"
 
         elif reward == "redeem":
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"redeems": 1}})
+            await ctx.update_member({"$inc": {"redeems": 1}})
             text = "1 redeem"
 
         elif reward in ("event", "pokemon", "rare", "shiny"):
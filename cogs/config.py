@@ -90,7 +90,7 @@ class Configuration(commands.Cog):
 
         if prefix in ("reset", "p!", "P!"):
             await self.bot.mongo.update_guild(ctx.guild, {"$set": {"prefix": None}})
-            self.bot.prefixes[ctx.guild.id] = None
+            self.bot.get_cog("Bot").invalidate_prefix(ctx.guild.id, None)
 
             return await ctx.send("Reset prefix to `p!` for this server.")
 
@@ -98,7 +98,7 @@ class Configuration(commands.Cog):
             return await ctx.send("Prefix must not be longer than 100 characters.")
 
         await self.bot.mongo.update_guild(ctx.guild, {"$set": {"prefix": prefix}})
-        self.bot.prefixes[ctx.guild.id] = prefix
+        self.bot.get_cog("Bot").invalidate_prefix(ctx.guild.id, prefix)
 
         await ctx.send(f"Changed prefix to `{prefix}` for this server.")
 
@@ -107,9 +107,9 @@ class Configuration(commands.Cog):
     async def silence(self, ctx: commands.Context):
         """Silence level up messages for yourself."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
-        await self.bot.mongo.update_member(ctx.author, {"$set": {"silence": not member.silence}})
+        await ctx.update_member({"$set": {"silence": not member.silence}})
 
         if member.silence:
             await ctx.send(f"Reverting to normal level up behavior.")
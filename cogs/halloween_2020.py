@@ -171,7 +171,7 @@ class Halloween(commands.Cog):
     async def halloween(self, ctx):
         """View halloween event information."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         embed = self.bot.Embed(
             title=f"Spooktober Event Shop",
@@ -198,7 +198,7 @@ class Halloween(commands.Cog):
     async def buy(self, ctx, *args):
         """Buy items from the Halloween shop."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         arg2 = None
         if args[-1].isdigit():
@@ -227,7 +227,7 @@ class Halloween(commands.Cog):
         if member.halloween_tickets < item["price"]:
             return await ctx.send("You don't have enough candies to buy that!")
 
-        await self.bot.mongo.update_member(ctx.author, {"$inc": {"halloween_tickets": -item["price"]}})
+        await ctx.update_member({"$inc": {"halloween_tickets": -item["price"]}})
 
         message = f"You bought a **{item['name']}** for **{item['price']} candies**."
 
@@ -259,7 +259,7 @@ class Halloween(commands.Cog):
             message += f" Use `{ctx.prefix}info latest` to view it!"
 
         elif item["action"] == "badge":
-            await self.bot.mongo.update_member(ctx.author, {"$set": {"halloween_badge": True}})
+            await ctx.update_member({"$set": {"halloween_badge": True}})
 
         elif item["action"] == "crate":
             reward = random.choices(*CRATE_REWARDS, k=1)[0]
@@ -271,7 +271,7 @@ class Halloween(commands.Cog):
                 text = [f"{shards} Shards"]
 
             elif reward == "redeem":
-                await self.bot.mongo.update_member(ctx.author, {"$inc": {"redeems": 1}})
+                await ctx.update_member({"$inc": {"redeems": 1}})
                 text.append("1 redeem")
 
             elif reward in ("special", "rare", "spooky", "shadow_lugia"):
@@ -315,7 +315,7 @@ class Halloween(commands.Cog):
 
                 await self.bot.mongo.db.pokemon.insert_one(pokemon)
 
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"premium_balance": shards}})
+            await ctx.update_member({"$inc": {"premium_balance": shards}})
 
             embed = self.bot.Embed(title="Opening Halloween Crate...")
             embed.add_field(name="Rewards Received", value="\n".join(text))
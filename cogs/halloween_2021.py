@@ -46,7 +46,7 @@ class Halloween(commands.Cog):
     #     if "Ghost" in species.types or "Dark" in species.types:
     #         if random.random() < 0.5:
     #             return
-    #         await self.bot.mongo.update_member(ctx.author, {"$inc": {"halloween_tickets_2021": 1}})
+    #         await ctx.update_member({"$inc": {"halloween_tickets_2021": 1}})
     #         await ctx.send(
     #             f"The Pokémon dropped a **🎫 Trick-or-Treat Ticket**! Use `{ctx.prefix}halloween` to view more info."
     #         )
@@ -56,7 +56,7 @@ class Halloween(commands.Cog):
     async def halloween(self, ctx):
         """View halloween event information."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         embed = self.bot.Embed(color=0xE67D23)
         embed.title = f"Halloween 2021"
@@ -99,7 +99,7 @@ class Halloween(commands.Cog):
     async def trickortreat(self, ctx):
         """Use a ticket to trick or treat."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if member.halloween_tickets_2021 <= 0:
             return await ctx.send("You don't have enough tickets to do that!")
@@ -114,11 +114,11 @@ class Halloween(commands.Cog):
 
         if reward == "shards":
             shards = round(random.normalvariate(25, 10))
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"premium_balance": shards}})
+            await ctx.update_member({"$inc": {"premium_balance": shards}})
             text = f"{shards} Shards"
 
         elif reward == "redeem":
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"redeems": 1}})
+            await ctx.update_member({"$inc": {"redeems": 1}})
             text = "1 redeem"
 
         elif reward in ("event", "spooky", "rare", "shiny"):
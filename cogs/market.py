@@ -91,19 +91,19 @@ class Market(commands.Cog):
             pokemon = self.bot.mongo.Pokemon.build_from_mongo(x)
             return f"`{padn(x['market_data']['_id'], menu.maxn)}`　**{pokemon:li}**　•　{pokemon.iv_total / 186:.2%}　•　{x['market_data']['price']:,} pc"
 
-        pokemon = self.bot.mongo.fetch_market_list(aggregations)
-
-        pages = pagination.ContinuablePages(
-            pagination.AsyncListPageSource(
-                pokemon,
-                title=f"Pokétwo Marketplace",
-                prepare_page=prepare_page,
-                format_item=format_item,
-                per_page=20,
-            ),
-            allow_last=False,
-            allow_go=False,
+        count = await self.bot.mongo.fetch_market_count(aggregations)
+        source = pagination.make_list_page_source(
+            self.bot.mongo.fetch_market_list,
+            aggregations,
+            count,
+            title=f"Pokétwo Marketplace",
+            prepare_page=prepare_page,
+            format_item=format_item,
+            per_page=20,
         )
+
+        seekable = isinstance(source, pagination.KeysetPageSource)
+        pages = pagination.ContinuablePages(source, allow_last=seekable, allow_go=seekable)
         self.bot.menus[ctx.author.id] = pages
 
         try:
@@ -127,7 +127,7 @@ class Market(commands.Cog):
         if price > 1000000000:
             return await ctx.send("Price is too high!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if member.selected_id == pokemon.id:
             return await ctx.send(f"{pokemon.idx}: You can't list your selected pokémon!")
@@ -217,7 +217,7 @@ class Market(commands.Cog):
         if listing is None:
             return await ctx.send("Couldn't find that listing!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if listing["owner_id"] == ctx.author.id:
             return await ctx.send("You can't purchase your own listing!")
@@ -244,18 +244,19 @@ class Market(commands.Cog):
         if listing is None:
             return await ctx.send("That listing no longer exists.")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         if member.balance < listing["market_data"]["price"]:
             return await ctx.send("You don't have enough Pokécoins for that!")
 
         # to try to avoid race conditions
         await asyncio.sleep(1)
+        ctx.invalidate_member_info()
 
         listing = await self.bot.mongo.db.pokemon.find_one({"owned_by": "market", "market_data._id": id})
         if listing is None:
             return await ctx.send("That listing no longer exists.")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         if member.balance < listing["market_data"]["price"]:
             return await ctx.send("You don't have enough Pokécoins for that!")
 
@@ -276,9 +277,9 @@ class Market(commands.Cog):
         res = await self.bot.mongo.db.member.find_one_and_update(
             {"_id": ctx.author.id}, {"$inc": {"balance": -listing["market_data"]["price"]}}
         )
-        await self.bot.redis.hdel("db:member", ctx.author.id)
+        await self.bot.mongo.invalidate_member(ctx.author.id)
         if res["balance"] < listing["market_data"]["price"]:
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"balance": listing["market_data"]["price"]}})
+            await ctx.update_member({"$inc": {"balance": listing["market_data"]["price"]}})
             return await ctx.send("You don't have enough Pokécoins for that!")
 
         await self.bot.mongo.update_member(listing["owner_id"], {"$inc": {"balance": listing["market_data"]["price"]}})
@@ -286,11 +287,9 @@ class Market(commands.Cog):
             f"You purchased a **{pokemon.iv_percentage:.2%} {pokemon.species}** from the market for {listing['market_data']['price']} Pokécoins. Do `{ctx.prefix}info latest` to view it!"
         )
 
-        self.bot.loop.create_task(
-            self.bot.send_dm(
-                listing["owner_id"],
-                f"Someone purchased your **{pokemon.iv_percentage:.2%} {pokemon.species}** from the market. You received {listing['market_data']['price']:,} Pokécoins!",
-            )
+        self.bot.queue_dm(
+            listing["owner_id"],
+            f"Someone purchased your **{pokemon.iv_percentage:.2%} {pokemon.species}** from the market. You received {listing['market_data']['price']:,} Pokécoins!",
         )
 
         self.bot.dispatch("market_buy", ctx.author, listing)
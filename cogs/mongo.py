@@ -1,14 +1,20 @@
+import asyncio
+import contextlib
 import math
-import pickle
 import random
+from collections import Counter as StatsCounter
 from datetime import datetime, timedelta, timezone
 
+import bson
 import discord
-import pymongo
 from bson.objectid import ObjectId
 from discord.ext import commands
+from discord.utils import MISSING
+from expiringdict import ExpiringDict
 from helpers import constants
+from helpers.utils import InvalidationTracker
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument
 from suntime import Sun
 from umongo import Document, EmbeddedDocument, Instance, MixinDocument, fields
 
@@ -17,6 +23,38 @@ from data import models
 random_iv = lambda: random.randint(0, 31)
 random_nature = lambda: random.choice(constants.NATURES)
 
+CATCH_REWARDS = {1: 35, 10: 350, 100: 3500, 1000: 35000, 10000: 350000, 100000: 3500000}
+
+# Cached members live in one expiring Redis key per member, db:member:<id>, holding the BSON-encoded document, or an
+# empty value for users without one. Writes delete the key.
+#
+# These replaced the single db:member hash. Services outside the bot (e.g. the vote webhook) that still invalidate
+# with HDEL db:member <id> are honored while MEMBER_LEGACY_INVALIDATION is on: filling the cache also sets a marker
+# field in db:member, and a cached value whose marker is gone is treated as a miss. Such services should move to
+# deleting db:member:<id> and publishing the id on member:invalidate, which also reaches the in-process caches.
+
+
+def encode_cached_member(doc):
+    return b"" if doc is None else bson.encode(doc)
+
+
+def decode_cached_member(data):
+    if data is None:
+        return MISSING
+    if len(data) == 0:
+        return None
+    return bson.decode(data)
+
+
+def pipeline_as_filter(aggregations):
+    # Stages that only match or reorder don't change which documents a pipeline selects, so such a pipeline can be
+    # run as a plain query. Anything else (e.g. $skip or $limit) selects by position and needs the pipeline itself.
+
+    if not all(next(iter(x)) in ("$match", "$sort") for x in aggregations):
+        return None
+    return [x["$match"] for x in aggregations if "$match" in x]
+
+
 # Instance
 
 
@@ -341,6 +379,8 @@ class Auction(Document):
     bid_increment = fields.IntegerField(required=True)
     bidder_id = fields.IntegerField(default=None)
     ends = fields.DateTimeField(required=True)
+    shard_id = fields.IntegerField(default=None)
+    shard_count = fields.IntegerField(default=None)
 
 
 class Guild(Document):
@@ -381,7 +421,10 @@ class Channel(Document):
         strict = False
 
     id = fields.IntegerField(attribute="_id")
+    guild_id = fields.IntegerField(default=None)
     spawns_remaining = fields.IntegerField(default=0)
+    shard_id = fields.IntegerField(default=None)
+    shard_count = fields.IntegerField(default=None)
 
     @property
     def incense_active(self):
@@ -404,6 +447,29 @@ class Sponsor(Document):
     reward_tier = fields.IntegerField()
 
 
+# Indexes the bot's queries rely on, by collection. These are created if missing when the first cluster starts up
+# (or with the admin indexes command); existing indexes are matched by key pattern, so their names don't matter.
+
+INDEXES = {
+    "pokemon": [
+        IndexModel([("owner_id", 1), ("owned_by", 1), ("idx", 1)]),
+        IndexModel([("market_data._id", 1)], sparse=True),
+        IndexModel([("owned_by", 1), ("market_data.price", 1)]),
+    ],
+    "auction": [
+        IndexModel([("ends", 1)]),
+        IndexModel([("guild_id", 1)]),
+        IndexModel([("shard_count", 1), ("shard_id", 1)]),
+    ],
+    "channel": [
+        IndexModel([("shard_count", 1), ("shard_id", 1), ("spawns_remaining", 1)]),
+    ],
+    "member": [
+        IndexModel([("need_vote_reminder", 1), ("last_voted", 1)]),
+    ],
+}
+
+
 class Mongo(commands.Cog):
     """For database operations."""
 
@@ -430,16 +496,165 @@ class Mongo(commands.Cog):
             setattr(self, x, instance.register(g[x]))
             getattr(self, x).bot = bot
 
+        # In-process member cache in front of the db:member:* keys in Redis. Clusters evict each other's entries
+        # over pub/sub, and member_invalidations keeps a read that raced an invalidation of the same member from being
+        # stored. Every caller gets the same cached object, so members from fetch_member_info must be treated as
+        # read-only.
+
+        self.member_cache = ExpiringDict(
+            max_len=getattr(bot.config, "MEMBER_CACHE_SIZE", 10000),
+            max_age_seconds=getattr(bot.config, "MEMBER_CACHE_TTL", 300),
+        )
+        self.member_cache_stats = StatsCounter()
+        self.member_invalidations = InvalidationTracker()
+        self._listen_task = bot.loop.create_task(
+            self.listen_invalidations("member:invalidate", self.member_cache, self.member_invalidations)
+        )
+
+        # Guild settings rarely change but are read for nearly every message, so they're kept in process too,
+        # preloaded per shard and evicted the same way as members.
+
+        self.guild_cache = ExpiringDict(
+            max_len=getattr(bot.config, "GUILD_CACHE_SIZE", 100000),
+            max_age_seconds=getattr(bot.config, "GUILD_CACHE_TTL", 3600),
+        )
+        self.guild_invalidations = InvalidationTracker()
+        self._guild_listen_task = bot.loop.create_task(
+            self.listen_invalidations("guild:invalidate", self.guild_cache, self.guild_invalidations)
+        )
+
+        # Building indexes on the large collections is slow, so this is opt-in. Otherwise it's left to the admin
+        # indexes command.
+
+        if bot.cluster_idx == 0 and getattr(bot.config, "ENSURE_INDEXES", False):
+            bot.loop.create_task(self.ensure_indexes_on_startup())
+
+    async def check_indexes(self):
+        # Compares the indexes in the database against INDEXES. Unused indexes are ones that $indexStats has
+        # recorded no operations on since the server started (or since the index was created).
+
+        def key_pattern(key):
+            # Indexes created from the shell have float directions
+            return tuple((k, int(v) if isinstance(v, (int, float)) else v) for k, v in key.items())
+
+        report = {}
+        for collection, models in INDEXES.items():
+            declared = [key_pattern(x.document["key"]) for x in models]
+            existing = {}
+            async for x in self.db[collection].aggregate([{"$indexStats": {}}]):
+                existing[key_pattern(x["key"])] = x
+
+            report[collection] = {
+                "missing": [models[i] for i, key in enumerate(declared) if key not in existing],
+                "extra": [x["name"] for key, x in existing.items() if key not in declared and x["name"] != "_id_"],
+                "unused": [x["name"] for x in existing.values() if x["accesses"]["ops"] == 0],
+            }
+
+        return report
+
+    async def ensure_indexes(self):
+        # Creates whichever declared indexes are missing. Extra indexes are only reported, never dropped.
+
+        report = await self.check_indexes()
+        for collection, result in report.items():
+            if len(result["missing"]) > 0:
+                names = await self.db[collection].create_indexes(result["missing"])
+                self.bot.log.info(f"Created indexes on {collection}: {', '.join(names)}")
+            if len(result["extra"]) > 0:
+                self.bot.log.info(f"Undeclared indexes on {collection}: {', '.join(result['extra'])}")
+            if len(result["unused"]) > 0:
+                self.bot.log.info(f"Unused indexes on {collection}: {', '.join(result['unused'])}")
+
+        return report
+
+    async def ensure_indexes_on_startup(self):
+        try:
+            await self.ensure_indexes()
+        except Exception:
+            self.bot.log.exception("Failed to ensure indexes")
+
+    async def listen_invalidations(self, name, cache, invalidations):
+        # Invalidations published while not subscribed are lost, so every (re)subscription starts from an empty
+        # cache and resets the tracker, which keeps reads that started before it from being stored.
+
+        await self.bot.wait_until_ready()
+        await self.bot.get_cog("Redis").wait_until_ready()
+
+        while True:
+            try:
+                (channel,) = await self.bot.redis.subscribe(name)
+                invalidations.reset()
+                cache.clear()
+                while await channel.wait_message():
+                    ids = [int(x) for x in (await channel.get(encoding="utf-8")).split(",")]
+                    invalidations.invalidate(*ids)
+                    for id in ids:
+                        cache.pop(id, None)
+                self.bot.log.warning(f"Unsubscribed from {name}, resubscribing")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.bot.log.exception(f"Lost subscription to {name}, resubscribing")
+            await asyncio.sleep(1)
+
+    async def invalidate_member(self, *ids):
+        ids = [int(x) for x in ids]
+        if len(ids) == 0:
+            return
+
+        self.member_invalidations.invalidate(*ids)
+        for id in ids:
+            self.member_cache.pop(id, None)
+
+        tr = self.bot.redis.multi_exec()
+        tr.delete(*[f"db:member:{x}" for x in ids])
+        if getattr(self.bot.config, "MEMBER_LEGACY_INVALIDATION", True):
+            tr.hdel("db:member", *ids)
+        tr.publish("member:invalidate", ",".join(str(x) for x in ids))
+        await tr.execute()
+
     async def fetch_member_info(self, member: discord.Member):
-        val = await self.bot.redis.hget(f"db:member", member.id)
-        if val is None:
+        val = self.member_cache.get(member.id, MISSING)
+        if val is not MISSING:
+            self.member_cache_stats["l1_hits"] += 1
+            return val
+
+        legacy = getattr(self.bot.config, "MEMBER_LEGACY_INVALIDATION", True)
+        token = self.member_invalidations.token()
+        tr = self.bot.redis.multi_exec()
+        tr.get(f"db:member:{member.id}")
+        if legacy:
+            tr.hexists("db:member", member.id)
+        data, *marked = await tr.execute()
+
+        if data is not None and legacy and not marked[0]:
+            # Invalidated by an outside service with HDEL, so the other clusters need telling too
+            await self.invalidate_member(member.id)
+            token = self.member_invalidations.token()
+            data = None
+
+        doc = decode_cached_member(data)
+        if doc is MISSING:
+            self.member_cache_stats["misses"] += 1
             val = await self.Member.find_one({"id": member.id}, {"pokemon": 0, "pokedex": 0})
-            v = "" if val is None else pickle.dumps(val.to_mongo())
-            await self.bot.redis.hset(f"db:member", member.id, v)
-        elif len(val) == 0:
-            return None
+            tr = self.bot.redis.multi_exec()
+            tr.set(
+                f"db:member:{member.id}",
+                encode_cached_member(val and val.to_mongo()),
+                expire=getattr(self.bot.config, "MEMBER_REDIS_TTL", 3600),
+            )
+            if legacy:
+                tr.hset("db:member", member.id, 1)
+            await tr.execute()
+        elif doc is None:
+            self.member_cache_stats["l2_hits"] += 1
+            val = None
         else:
-            val = self.Member.build_from_mongo(pickle.loads(val))
+            self.member_cache_stats["l2_hits"] += 1
+            val = self.Member.build_from_mongo(doc)
+
+        if not self.member_invalidations.changed(member.id, token):
+            self.member_cache[member.id] = val
         return val
 
     async def fetch_next_idx(self, member: discord.Member, reserve=1):
@@ -448,7 +663,7 @@ class Mongo(commands.Cog):
             {"$inc": {"next_idx": reserve}},
             projection={"next_idx": 1},
         )
-        await self.bot.redis.hdel(f"db:member", member.id)
+        await self.invalidate_member(member.id)
         return result["next_idx"]
 
     async def reset_idx(self, member: discord.Member, value):
@@ -457,9 +672,101 @@ class Mongo(commands.Cog):
             {"$set": {"next_idx": value}},
             projection={"next_idx": 1},
         )
-        await self.bot.redis.hdel(f"db:member", member.id)
+        await self.invalidate_member(member.id)
         return result["next_idx"]
 
+    async def commit_catch(self, member: discord.Member, species, quests=None):
+        # Reserving the idx and bumping the pokedex and quest counters happens atomically in one round trip, and
+        # the pre-image it returns is enough to work out every reward, so the rest can be written concurrently.
+
+        incs = {"next_idx": 1, f"pokedex.{species.dex_number}": 1}
+        projection = {
+            "next_idx": 1,
+            "shiny_hunt": 1,
+            "shiny_streak": 1,
+            "shiny_charm_expires": 1,
+            "catch_mention": 1,
+            f"pokedex.{species.dex_number}": 1,
+        }
+        quests = quests or {}
+        for id in quests:
+            incs[f"quest_progress.{id}"] = 1
+            projection[f"quest_progress.{id}"] = 1
+
+        result = await self.db.member.find_one_and_update(
+            {"_id": member.id}, {"$inc": incs}, projection=projection, return_document=ReturnDocument.BEFORE
+        )
+        if result is None:
+            return None
+
+        val = self.Member.build_from_mongo(result)
+
+        shiny = val.determine_shiny(species)
+        level = min(max(int(random.normalvariate(20, 10)), 1), 100)
+        moves = [x.move.id for x in species.moves if level >= x.method.level]
+        random.shuffle(moves)
+        ivs = [random_iv() for i in range(6)]
+
+        pokemon = {
+            "owner_id": member.id,
+            "owned_by": "user",
+            "species_id": species.id,
+            "level": level,
+            "xp": 0,
+            "nature": random_nature(),
+            "iv_hp": ivs[0],
+            "iv_atk": ivs[1],
+            "iv_defn": ivs[2],
+            "iv_satk": ivs[3],
+            "iv_sdef": ivs[4],
+            "iv_spd": ivs[5],
+            "iv_total": sum(ivs),
+            "moves": moves[:4],
+            "shiny": shiny,
+            "idx": val.next_idx,
+        }
+
+        count = val.pokedex.get(str(species.dex_number), 0) + 1
+        reward = CATCH_REWARDS.get(count, 0)
+        update = {"$inc": {}, "$set": {}}
+
+        if shiny:
+            update["$inc"]["shinies_caught"] = 1
+
+        if val.shiny_hunt == species.dex_number:
+            if shiny:
+                update["$set"]["shiny_streak"] = 0
+            else:
+                update["$inc"]["shiny_streak"] = 1
+
+        completed = []
+        for id, quest in quests.items():
+            prog = val.quest_progress.get(id, 0) + 1
+            if prog not in quest["counts"]:
+                continue
+            i = quest["counts"].index(prog)
+            reward += quest["rewards"][i]
+            if i == len(quest["counts"]) - 1:
+                update["$set"][f"badges.{quest['final_reward']}"] = True
+            completed.append({**quest, "_id": id, "index": i})
+
+        if reward > 0:
+            update["$inc"]["balance"] = reward
+
+        update = {k: v for k, v in update.items() if len(v) > 0}
+        if len(update) > 0:
+            await asyncio.gather(self.db.pokemon.insert_one(pokemon), self.update_member(member, update))
+        else:
+            await asyncio.gather(self.db.pokemon.insert_one(pokemon), self.invalidate_member(member.id))
+
+        return {
+            "member": val,
+            "pokemon": self.Pokemon.build_from_mongo(pokemon),
+            "pokedex_count": count,
+            "reward": CATCH_REWARDS.get(count, 0),
+            "quests": completed,
+        }
+
     async def fetch_pokedex(self, member: discord.Member, start: int, end: int):
 
         filter_obj = {}
@@ -476,6 +783,21 @@ class Mongo(commands.Cog):
         ]
         return self.db.pokemon.aggregate(pipeline, allowDiskUse=True)
 
+    async def fetch_market_count(self, aggregations=[]):
+        result = await self.db.pokemon.aggregate(
+            [
+                {"$match": {"owned_by": "market"}},
+                *aggregations,
+                {"$count": "num_matches"},
+            ],
+            allowDiskUse=True,
+        ).to_list(None)
+
+        if len(result) == 0:
+            return 0
+
+        return result[0]["num_matches"]
+
     async def fetch_auction_list(self, guild, aggregations=[]):
         async for x in self.db.auction.aggregate(
             [
@@ -525,6 +847,146 @@ class Mongo(commands.Cog):
 
         return result[0]["num_matches"]
 
+    async def explain_pokemon_query(self, member: discord.Member, aggregations=[]):
+        # Summarizes how the server runs a pokemon filter pipeline: the plan stages, the indexes used, and how much
+        # it had to look at to produce its results.
+
+        result = await self.db.command(
+            "explain",
+            {
+                "aggregate": "pokemon",
+                "pipeline": [{"$match": {"owner_id": member.id, "owned_by": "user"}}, *aggregations],
+                "cursor": {},
+            },
+            verbosity="executionStats",
+        )
+
+        if "stages" in result:
+            result = result["stages"][0]["$cursor"]
+
+        stages, indexes = [], []
+
+        def walk(plan):
+            if isinstance(plan, list):
+                for x in plan:
+                    walk(x)
+            elif isinstance(plan, dict):
+                if "stage" in plan:
+                    stages.append(plan["stage"])
+                if "indexName" in plan and plan["indexName"] not in indexes:
+                    indexes.append(plan["indexName"])
+                for x in plan.values():
+                    walk(x)
+
+        walk(result["queryPlanner"]["winningPlan"])
+        stats = result.get("executionStats", {})
+
+        return {
+            "stages": stages,
+            "indexes": indexes,
+            "keys_examined": stats.get("totalKeysExamined", 0),
+            "docs_examined": stats.get("totalDocsExamined", 0),
+            "returned": stats.get("nReturned", 0),
+            "time": stats.get("executionTimeMillis", 0),
+        }
+
+    async def fetch_pokemon_facets(self, member: discord.Member, aggregations=[], facets={}):
+        # Runs several sub-pipelines over a single pass of the filtered pokemon
+
+        result = await self.db.pokemon.aggregate(
+            [
+                {"$match": {"owner_id": member.id, "owned_by": "user"}},
+                *aggregations,
+                {"$facet": facets},
+            ],
+            allowDiskUse=True,
+        ).to_list(None)
+
+        return result[0]
+
+    async def fetch_pokemon_counts(self, member: discord.Member, aggregations=[], **filters):
+        facets = {"count": [{"$count": "num_matches"}]}
+        for k, v in filters.items():
+            facets[k] = [{"$match": v}, {"$count": "num_matches"}]
+
+        result = await self.fetch_pokemon_facets(member, aggregations, facets)
+        return {k: v[0]["num_matches"] if len(v) > 0 else 0 for k, v in result.items()}
+
+    async def fetch_pokemon_count_and_list(self, member: discord.Member, aggregations=[], skip=0, limit=20):
+        result = await self.fetch_pokemon_facets(
+            member,
+            aggregations,
+            {
+                "count": [{"$count": "num_matches"}],
+                "pokemon": [*([{"$skip": skip}] if skip > 0 else []), {"$limit": limit}],
+            },
+        )
+
+        count = result["count"][0]["num_matches"] if len(result["count"]) > 0 else 0
+        return count, [self.Pokemon.build_from_mongo(x) for x in result["pokemon"]]
+
+    async def update_pokemon_many(self, member: discord.Member, aggregations, update, progress=None):
+        # Applies an update to every pokemon selected by a filter pipeline, returning the number modified. When the
+        # pipeline is just a query, the update runs server-side in one go; otherwise only the matching _ids are
+        # streamed back and updated in chunks, reporting the running total to progress after each one.
+
+        base = {"owner_id": member.id, "owned_by": "user"}
+
+        matches = pipeline_as_filter(aggregations)
+        if matches is not None:
+            result = await self.db.pokemon.update_many({"$and": [base, *matches]}, update)
+            return result.modified_count
+
+        chunk_size = getattr(self.bot.config, "BULK_UPDATE_CHUNK_SIZE", 5000)
+        modified = done = 0
+
+        async def flush(ids):
+            nonlocal modified, done
+            result = await self.db.pokemon.update_many({**base, "_id": {"$in": ids}}, update)
+            modified += result.modified_count
+            done += len(ids)
+            if progress is not None:
+                await progress(done)
+
+        ids = []
+        cursor = self.db.pokemon.aggregate(
+            [{"$match": base}, *aggregations, {"$project": {"_id": 1}}],
+            allowDiskUse=True,
+            batchSize=chunk_size,
+        )
+        async for x in cursor:
+            ids.append(x["_id"])
+            if len(ids) >= chunk_size:
+                await flush(ids)
+                ids = []
+        if len(ids) > 0:
+            await flush(ids)
+
+        return modified
+
+    async def bulk_write_pokemon(self, requests, session=None):
+        # Sends pokemon write requests in chunks of at most BULK_UPDATE_CHUNK_SIZE, returning the number matched
+
+        chunk_size = getattr(self.bot.config, "BULK_UPDATE_CHUNK_SIZE", 5000)
+        matched = 0
+        for i in range(0, len(requests), chunk_size):
+            result = await self.db.pokemon.bulk_write(requests[i : i + chunk_size], ordered=False, session=session)
+            matched += result.matched_count
+        return matched
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        # Multi-document transactions need a replica set, so they're opt-in with USE_TRANSACTIONS. Without them this
+        # yields None, and each write made with the session is applied on its own.
+
+        if not getattr(self.bot.config, "USE_TRANSACTIONS", False):
+            yield None
+            return
+
+        async with await self.client.start_session() as session:
+            async with session.start_transaction():
+                yield session
+
     async def fetch_pokedex_count(self, member: discord.Member, aggregations=[]):
 
         result = await self.db.member.aggregate(
@@ -566,8 +1028,11 @@ class Mongo(commands.Cog):
     async def update_member(self, member, update):
         if hasattr(member, "id"):
             member = member.id
+        # The cached hash is deleted rather than patched. Mirroring an $inc into it could count the increment twice if
+        # another cluster refilled the hash from the updated document in between.
+
         result = await self.db.member.update_one({"_id": member}, update)
-        await self.bot.redis.hdel(f"db:member", int(member))
+        await self.invalidate_member(member)
         return result
 
     async def update_pokemon(self, pokemon, update):
@@ -604,18 +1069,51 @@ class Mongo(commands.Cog):
 
         return self.Pokemon.build_from_mongo(result)
 
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        # Guilds without a document are cached as None, so they don't each cost a query later. The loaded settings
+        # are passed on in a guilds_loaded event, which is how the Bot cog fills its prefix cache from the same read.
+
+        ids = [x.id for x in self.bot.guilds if x.shard_id == shard_id]
+        for i in range(0, len(ids), 1000):
+            token = self.guild_invalidations.token()
+            guilds = dict.fromkeys(ids[i : i + 1000])
+            async for g in self.Guild.find({"id": {"$in": list(guilds)}}):
+                guilds[g.id] = g
+            guilds = {id: g for id, g in guilds.items() if not self.guild_invalidations.changed(id, token)}
+            for id, g in guilds.items():
+                self.guild_cache[id] = g
+            self.bot.dispatch("guilds_loaded", guilds)
+
+    async def invalidate_guild(self, *ids):
+        ids = [int(x) for x in ids]
+        if len(ids) == 0:
+            return
+
+        self.guild_invalidations.invalidate(*ids)
+        for id in ids:
+            self.guild_cache.pop(id, None)
+        await self.bot.redis.publish("guild:invalidate", ",".join(str(x) for x in ids))
+
     async def fetch_guild(self, guild: discord.Guild):
-        g = await self.Guild.find_one({"id": guild.id})
+        # Guilds without a document get default settings, which aren't written back; update_guild upserts. They're
+        # cached as None.
+
+        g = self.guild_cache.get(guild.id, MISSING)
+        if g is MISSING:
+            token = self.guild_invalidations.token()
+            g = await self.Guild.find_one({"id": guild.id})
+            if not self.guild_invalidations.changed(guild.id, token):
+                self.guild_cache[guild.id] = g
+
         if g is None:
             g = self.Guild(id=guild.id)
-            try:
-                await g.commit()
-            except pymongo.errors.DuplicateKeyError:
-                pass
         return g
 
     async def update_guild(self, guild: discord.Guild, update):
-        return await self.db.guild.update_one({"_id": guild.id}, update, upsert=True)
+        result = await self.db.guild.update_one({"_id": guild.id}, update, upsert=True)
+        await self.invalidate_guild(guild.id)
+        return result
 
     async def fetch_channel(self, channel: discord.TextChannel):
         c = await self.Channel.find_one({"id": channel.id})
@@ -625,8 +1123,39 @@ class Mongo(commands.Cog):
         return c
 
     async def update_channel(self, channel: discord.TextChannel, update):
+        if getattr(channel, "guild", None) is not None:
+            update = {**update, "$set": {**update.get("$set", {}), **self.shard_fields(channel.guild.id)}}
         return await self.db.channel.update_one({"_id": channel.id}, update, upsert=True)
 
+    def shard_fields(self, guild_id):
+        # Stored on channels and auctions so that local_shard_filter can use an index. shard_count is kept alongside
+        # so documents written under a different shard count can be found and fixed by refresh_shard_ids.
+
+        return {
+            "guild_id": guild_id,
+            "shard_id": (guild_id >> 22) % self.bot.shard_count,
+            "shard_count": self.bot.shard_count,
+        }
+
+    def local_shard_filter(self):
+        return {"shard_count": self.bot.shard_count, "shard_id": {"$in": list(self.bot.shard_ids)}}
+
+    async def refresh_shard_ids(self, collection):
+        # Recomputes shard_id for documents written under a different shard count, or before it was stored. The
+        # modulo is taken on the full id first so the division is exact.
+
+        shard = {"$floor": {"$divide": [{"$mod": ["$guild_id", self.bot.shard_count << 22]}, 1 << 22]}}
+        result = await self.db[collection].update_many(
+            {"shard_count": {"$ne": self.bot.shard_count}, "guild_id": {"$ne": None}},
+            [{"$set": {"shard_id": shard, "shard_count": self.bot.shard_count}}],
+        )
+        if result.modified_count > 0:
+            self.bot.log.info(f"Refreshed shard IDs of {result.modified_count} documents in {collection}")
+
+    def cog_unload(self):
+        self._listen_task.cancel()
+        self._guild_listen_task.cancel()
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Mongo(bot))
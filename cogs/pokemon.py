@@ -1,6 +1,5 @@
 import asyncio
 import contextlib
-import itertools
 import math
 import re
 import typing
@@ -11,6 +10,7 @@ import discord
 from discord.errors import DiscordException
 from discord.ext import commands
 from helpers import checks, constants, converters, flags, pagination
+from helpers.query import QueryBuilder
 from pymongo import UpdateOne
 
 
@@ -141,7 +141,7 @@ class Pokemon(commands.Cog):
 
         nicknameall = " ".join(flags["newname"])
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         aggregations = await self.create_filter(flags, ctx, order_by=member.order_by)
 
         if aggregations is None:
@@ -179,11 +179,11 @@ class Pokemon(commands.Cog):
         # confirmed, nickname all
         await ctx.send(f"Renaming {num} pokémon, this might take a while...")
 
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
-        await self.bot.mongo.db.pokemon.update_many(
-            {"_id": {"$in": [x.id async for x in pokemon]}},
+        await self.bot.mongo.update_pokemon_many(
+            ctx.author,
+            aggregations,
             {"$set": {"nickname": nicknameall}},
+            progress=self.report_progress(ctx, "Renamed", num),
         )
 
         if nicknameall is None:
@@ -318,17 +318,17 @@ class Pokemon(commands.Cog):
     async def favoriteall(self, ctx, **flags):
         """Mass favorite selected pokemon."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         aggregations = await self.create_filter(flags, ctx, order_by=member.order_by)
 
         if aggregations is None:
             return
 
         # Check pokemon and unfavorited pokemon num
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        counts = await self.bot.mongo.fetch_pokemon_counts(ctx.author, aggregations, unfav={"favorite": {"$ne": True}})
+        num, unfavnum = counts["count"], counts["unfav"]
 
         aggregations.append({"$match": {"favorite": {"$ne": True}}})
-        unfavnum = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
 
         if num == 0:
             return await ctx.send("Found no pokémon matching this search.")
@@ -337,9 +337,6 @@ class Pokemon(commands.Cog):
                 f"Found no unfavorited pokémon within this selection.\nTo mass unfavorite a pokemon, please use `{ctx.prefix}unfavoriteall`."
             )
 
-        # Fetch pokemon list
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
         # confirm
 
         result = await ctx.confirm(f"Are you sure you want to **favorite** your {unfavnum} pokémon?")
@@ -348,9 +345,11 @@ class Pokemon(commands.Cog):
         if result is False:
             return await ctx.send("Aborted.")
 
-        await self.bot.mongo.db.pokemon.update_many(
-            {"_id": {"$in": [x.id async for x in pokemon]}},
+        await self.bot.mongo.update_pokemon_many(
+            ctx.author,
+            aggregations,
             {"$set": {"favorite": True}},
+            progress=self.report_progress(ctx, "Favorited", unfavnum),
         )
 
         await ctx.send(f"Favorited your {unfavnum} unfavorited pokemon.\nAll {num} selected pokemon are now favorited.")
@@ -405,26 +404,23 @@ class Pokemon(commands.Cog):
     async def unfavoriteall(self, ctx, **flags):
         """Mass unfavorite selected pokemon."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         aggregations = await self.create_filter(flags, ctx, order_by=member.order_by)
 
         if aggregations is None:
             return
 
         # Check pokemon and unfavorited pokemon num
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        counts = await self.bot.mongo.fetch_pokemon_counts(ctx.author, aggregations, fav={"favorite": True})
+        num, favnum = counts["count"], counts["fav"]
 
         aggregations.append({"$match": {"favorite": True}})
-        favnum = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
 
         if num == 0:
             return await ctx.send("Found no pokémon matching this search.")
         elif favnum == 0:
             return await ctx.send("Found no favorited pokémon within this selection.")
 
-        # Fetch pokemon list
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
         # confirm
 
         result = await ctx.confirm(f"Are you sure you want to **unfavorite** your {favnum} pokémon?")
@@ -433,9 +429,11 @@ class Pokemon(commands.Cog):
         if result is False:
             return await ctx.send("Aborted.")
 
-        await self.bot.mongo.db.pokemon.update_many(
-            {"_id": {"$in": [x.id async for x in pokemon]}},
+        await self.bot.mongo.update_pokemon_many(
+            ctx.author,
+            aggregations,
             {"$set": {"favorite": False}},
+            progress=self.report_progress(ctx, "Unfavorited", favnum),
         )
 
         await ctx.send(f"Unfavorited your {favnum} favorited pokemon.\nAll {num} selected pokemon are now unfavorited.")
@@ -529,8 +527,7 @@ class Pokemon(commands.Cog):
         if pokemon is None:
             return await ctx.send("Couldn't find that pokémon!")
 
-        await self.bot.mongo.update_member(
-            ctx.author,
+        await ctx.update_member(
             {"$set": {f"selected_id": pokemon.id}},
         )
 
@@ -548,8 +545,7 @@ class Pokemon(commands.Cog):
                 "Please specify either `iv`, `iv+`, `iv-`, `level`, `level+`, `level-`, `number`, `number+`, `number-`, `pokedex`, `pokedex+` or `pokedex-`"
             )
 
-        await self.bot.mongo.update_member(
-            ctx.author,
+        await ctx.update_member(
             {"$set": {f"order_by": sort}},
         )
 
@@ -572,62 +568,77 @@ class Pokemon(commands.Cog):
 
         return ops
 
+    def report_progress(self, ctx, action, total):
+        # Progress callback for update_pokemon_many, kept to a single message that is edited as chunks complete
+
+        message = None
+
+        async def progress(done):
+            nonlocal message
+            content = f"{action} {done:,}/{total:,} pokémon..."
+            if message is None:
+                message = await ctx.send(content)
+            else:
+                await message.edit(content=content)
+
+        return progress
+
     async def create_filter(self, flags, ctx, order_by=None, map_field=lambda x: x):
-        aggregations = []
+        # All of the flags are compiled into one leading $match (see helpers.query), so that the planner sees the
+        # whole query at once and searches that can't match anything don't have to scan for it.
+
+        query = QueryBuilder()
 
         if "mine" in flags and flags["mine"]:
-            aggregations.append({"$match": {map_field("owner_id"): ctx.author.id}})
+            query.equals(map_field("owner_id"), ctx.author.id)
 
         if "bids" in flags and flags["bids"]:
-            aggregations.append({"$match": {"bidder_id": ctx.author.id}})
+            query.equals("bidder_id", ctx.author.id)
 
         rarity = []
         for x in ("mythical", "legendary", "ub"):
             if x in flags and flags[x]:
                 rarity += getattr(self.bot.data, f"list_{x}")
         if rarity:
-            aggregations.append({"$match": {map_field("species_id"): {"$in": rarity}}})
+            query.restrict(map_field("species_id"), rarity)
 
         for x in ("alolan", "galarian", "hisuian", "mega", "event"):
             if x in flags and flags[x]:
-                aggregations.append({"$match": {map_field("species_id"): {"$in": getattr(self.bot.data, f"list_{x}")}}})
+                query.restrict(map_field("species_id"), getattr(self.bot.data, f"list_{x}"))
 
         if "type" in flags and flags["type"]:
             all_species = [i for x in flags["type"] for i in self.bot.data.list_type(x)]
-            aggregations.append({"$match": {map_field("species_id"): {"$in": all_species}}})
+            query.restrict(map_field("species_id"), all_species)
 
         if "region" in flags and flags["region"]:
             all_species = [i for x in flags["region"] for i in self.bot.data.list_region(x)]
-            aggregations.append({"$match": {map_field("species_id"): {"$in": all_species}}})
+            query.restrict(map_field("species_id"), all_species)
 
         if "favorite" in flags and flags["favorite"]:
-            aggregations.append({"$match": {map_field("favorite"): True}})
+            query.equals(map_field("favorite"), True)
 
         if "shiny" in flags and flags["shiny"]:
-            aggregations.append({"$match": {map_field("shiny"): True}})
+            query.equals(map_field("shiny"), True)
 
         if "name" in flags and flags["name"] is not None:
             all_species = [i for x in flags["name"] for i in self.bot.data.find_all_matches(" ".join(x))]
-
-            aggregations.append({"$match": {map_field("species_id"): {"$in": all_species}}})
+            query.restrict(map_field("species_id"), all_species)
 
         if "nickname" in flags and flags["nickname"] is not None:
-            aggregations.append(
+            query.add(
                 {
-                    "$match": {
-                        map_field("nickname"): {
-                            "$regex": "(" + ")|(".join(" ".join(x) for x in flags["nickname"]) + ")",
-                            "$options": "i",
-                        }
+                    map_field("nickname"): {
+                        "$regex": "(" + ")|(".join(" ".join(x) for x in flags["nickname"]) + ")",
+                        "$options": "i",
                     }
                 }
             )
 
         if "embedcolor" in flags and flags["embedcolor"]:
-            aggregations.append({"$match": {map_field("has_color"): True}})
+            query.equals(map_field("has_color"), True)
 
         if "ends" in flags and flags["ends"] is not None:
-            aggregations.append({"$match": {"ends": {"$lt": datetime.utcnow() + flags["ends"]}}})
+            query.less_than("ends", datetime.utcnow() + flags["ends"])
 
         # Numerical flags
 
@@ -644,28 +655,19 @@ class Pokemon(commands.Cog):
                     ops[1] = float(ops[1]) * 186 / 100
 
                 if ops[0] == "<":
-                    aggregations.append(
-                        {"$match": {map_field(expr): {"$lt": math.ceil(ops[1])}}},
-                    )
+                    query.less_than(map_field(expr), math.ceil(ops[1]))
                 elif ops[0] == "=":
-                    aggregations.append(
-                        {"$match": {map_field(expr): {"$eq": round(ops[1])}}},
-                    )
+                    query.equals(map_field(expr), round(ops[1]))
                 elif ops[0] == ">":
-                    aggregations.append(
-                        {"$match": {map_field(expr): {"$gt": math.floor(ops[1])}}},
-                    )
+                    query.greater_than(map_field(expr), math.floor(ops[1]))
 
         for flag, amt in constants.FILTER_BY_DUPLICATES.items():
             if flag in flags and flags[flag] is not None:
-                iv = int(flags[flag])
+                query.any_equal([map_field(field) for field in constants.IV_FIELDS], int(flags[flag]), amt)
 
-                # Processing combinations
-                combinations = [
-                    {map_field(field): iv for field in combo}
-                    for combo in itertools.combinations(constants.IV_FIELDS, amt)
-                ]
-                aggregations.append({"$match": {"$or": combinations}})
+        aggregations = []
+        if match := query.build():
+            aggregations.append({"$match": match})
 
         if order_by is not None:
             s = order_by[-1]
@@ -691,7 +693,7 @@ class Pokemon(commands.Cog):
     async def release(self, ctx, args: commands.Greedy[converters.PokemonConverter]):
         """Release pokémon from your collection for 2pc each."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         ids = set()
         mons = list()
@@ -745,8 +747,7 @@ class Pokemon(commands.Cog):
             {"owner_id": ctx.author.id, "_id": {"$in": list(ids)}},
             {"$set": {"owned_by": "released"}},
         )
-        await self.bot.mongo.update_member(
-            ctx.author,
+        await ctx.update_member(
             {
                 "$inc": {"balance": 2 * result.modified_count},
             },
@@ -802,13 +803,13 @@ class Pokemon(commands.Cog):
     async def releaseall(self, ctx, **flags):
         """Mass release pokémon from your collection for 2 pc each."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         aggregations = await self.create_filter(flags, ctx, order_by=member.order_by)
 
         if aggregations is None:
             return
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         aggregations.extend(
             [
@@ -837,28 +838,23 @@ class Pokemon(commands.Cog):
 
         # confirmed, release all
 
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
-
         await ctx.send(f"Releasing {num} pokémon, this might take a while...")
 
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
-        result = await self.bot.mongo.db.pokemon.update_many(
-            {"owner_id": ctx.author.id, "_id": {"$in": [x.id async for x in pokemon]}},
+        modified_count = await self.bot.mongo.update_pokemon_many(
+            ctx.author,
+            aggregations,
             {"$set": {"owned_by": "released"}},
+            progress=self.report_progress(ctx, "Released", num),
         )
 
-        await self.bot.mongo.update_member(
-            ctx.author,
+        await ctx.update_member(
             {
-                "$inc": {"balance": 2 * result.modified_count},
+                "$inc": {"balance": 2 * modified_count},
             },
         )
 
-        await ctx.send(
-            f"You have released {result.modified_count} pokémon. You received {2*result.modified_count:,} Pokécoins!"
-        )
-        self.bot.dispatch("release", ctx.author, result.modified_count)
+        await ctx.send(f"You have released {modified_count} pokémon. You received {2*modified_count:,} Pokécoins!")
+        self.bot.dispatch("release", ctx.author, modified_count)
 
     # Filter
     @flags.add_flag("page", nargs="?", type=int, default=1)
@@ -898,6 +894,9 @@ class Pokemon(commands.Cog):
     @flags.add_flag("--skip", type=int)
     @flags.add_flag("--limit", type=int)
 
+    # Owner-only: show the compiled query and its plan instead of the results
+    @flags.add_flag("--explain", action="store_true")
+
     # Pokemon
     @checks.has_started()
     @commands.cooldown(1, 5, commands.BucketType.user)
@@ -908,12 +907,23 @@ class Pokemon(commands.Cog):
         if flags["page"] < 1:
             return await ctx.send("Page must be positive!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         aggregations = await self.create_filter(flags, ctx, order_by=member.order_by)
         if aggregations is None:
             return
 
+        if flags["explain"] and await self.bot.is_owner(ctx.author):
+            plan = await self.bot.mongo.explain_pokemon_query(ctx.author, aggregations)
+            embed = self.bot.Embed(title="Query Plan")
+            embed.description = f"```py\n{aggregations}```"[:4096]
+            embed.add_field(name="Indexes", value=", ".join(plan["indexes"]) or "None (collection scan)", inline=False)
+            embed.add_field(name="Stages", value=" → ".join(reversed(plan["stages"])), inline=False)
+            embed.add_field(name="Keys Examined", value=f"{plan['keys_examined']:,}")
+            embed.add_field(name="Docs Examined", value=f"{plan['docs_examined']:,}")
+            embed.add_field(name="Returned", value=f"{plan['returned']:,} in {plan['time']:,} ms")
+            return await ctx.send(embed=embed)
+
         # Filter pokemon
 
         def padn(p, n):
@@ -925,17 +935,30 @@ class Pokemon(commands.Cog):
         def format_item(menu, p):
             return f"`{padn(p, menu.maxn)}`　**{p:nif}**　•　Lvl. {p.level}　•　{p.iv_total / 186:.2%}"
 
-        count = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations)
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
+        # Fetch the count and the requested page together when the source will seek
+
+        prefetched = {}
+        if pagination.KeysetPageSource.can_seek(aggregations):
+            count, entries = await self.bot.mongo.fetch_pokemon_count_and_list(
+                ctx.author,
+                pagination.KeysetPageSource.tiebroken(aggregations),
+                skip=(flags["page"] - 1) * 20,
+                limit=20,
+            )
+            prefetched[flags["page"] - 1] = entries
+        else:
+            count = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations)
 
         pages = pagination.ContinuablePages(
-            pagination.AsyncListPageSource(
-                pokemon,
+            pagination.make_list_page_source(
+                lambda aggs: self.bot.mongo.fetch_pokemon_list(ctx.author, aggs),
+                aggregations,
+                count,
+                prefetched=prefetched,
                 title="Your pokémon",
                 prepare_page=prepare_page,
                 format_item=format_item,
                 per_page=20,
-                count=count,
             )
         )
         pages.current_page = flags["page"] - 1
@@ -1155,7 +1178,7 @@ class Pokemon(commands.Cog):
         if not all(pokemon is not None for pokemon in args):
             return await ctx.send("Couldn't find that pokémon!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         guild = await self.bot.mongo.fetch_guild(ctx.guild)
 
         embed = self.bot.Embed(description="", title=f"Congratulations {ctx.author.display_name}!")
@@ -1,9 +1,7 @@
 import math
-from collections import defaultdict
 
 from discord.ext import commands
 from helpers import checks
-from pymongo import ReturnDocument
 
 name = lambda r: lambda c: f"Catch {c} pokémon originally found in the {r.title()} region."
 
@@ -97,38 +95,26 @@ class Quests(commands.Cog):
                 return False
         return True
 
-    @commands.Cog.listener()
-    async def on_catch(self, ctx, species):
-        quests = await self.get_quests(ctx.author)
-        incs = defaultdict(lambda: 0)
-
-        for q in quests:
-            if q["event"] != "catch":
-                continue
-            if self.verify_condition(q["condition"], species):
-                incs[f"quest_progress.{q['_id']}"] += 1
-
-        if len(incs) == 0:
-            return
-
-        m = await self.bot.mongo.db.member.find_one_and_update(
-            {"_id": ctx.author.id}, {"$inc": incs}, return_document=ReturnDocument.AFTER
-        )
-        await self.bot.redis.hdel(f"db:member", ctx.author.id)
-
-        for q in quests:
-            if "quest_progress." + q["_id"] not in incs:
-                continue
-            if m["quest_progress"][q["_id"]] == q["next_count"]:
-                await self.bot.mongo.update_member(ctx.author, {"$inc": {"balance": q["next_reward"]}})
+    def get_catch_tracks(self, species, member):
+        # Tracks the member has already completed are skipped, so their progress stops at the last count
+
+        return {
+            id: quest
+            for id, quest in CATCHING_TRACKS.items()
+            if quest["event"] == "catch"
+            and member.quest_progress.get(id, 0) < quest["counts"][-1]
+            and self.verify_condition(quest["condition"], species)
+        }
+
+    async def send_completed(self, ctx, completed):
+        for q in completed:
+            description = q["description"](q["counts"][q["index"]])
+            reward = q["rewards"][q["index"]]
+            await ctx.send(f"You have completed the quest **{description}** and received **{reward:,}** Pokécoins!")
+            if q["index"] == len(q["counts"]) - 1:
                 await ctx.send(
-                    f"You have completed the quest **{q['description']}** and received **{q['next_reward']:,}** Pokécoins!"
+                    f"You have completed this quest track and received the **{q['final_reward'].title()}** badge!"
                 )
-                if q["next_is_last"]:
-                    await self.bot.mongo.update_member(ctx.author, {"$set": {f"badges.{q['final_reward']}": True}})
-                    await ctx.send(
-                        f"You have completed this quest track and received the **{q['final_reward'].title()}** badge!"
-                    )
 
 
 async def setup(bot: commands.Bot):
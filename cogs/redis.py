@@ -1,6 +1,110 @@
+import asyncio
+import hashlib
+import json
+import pickle
+import time
+from collections import Counter as StatsCounter
+
 import aioredis
 from discord.ext import commands
 
+# Lua scripts run with run_script. They're loaded with SCRIPT LOAD when the pool connects and called by their SHA1,
+# so only the digest is sent with each call.
+
+SCRIPTS = {
+    # Reads the wild pokemon in a channel for a catch or hint, counting the attempt toward the captcha threshold.
+    # Returns {0} if there's no wild pokemon, {1} if the user must solve a captcha, or {2, species id}.
+    # KEYS: wild, captcha, catches:<user id>; ARGV: channel id, user id, counter ttl, captcha threshold
+    "check_wild": """
+        local species = redis.call("hget", KEYS[1], ARGV[1])
+        if not species then
+            return {0}
+        end
+        if redis.call("hexists", KEYS[2], ARGV[2]) == 1 then
+            return {1}
+        end
+        local count = redis.call("hincrby", KEYS[3], 1, 1)
+        if count == 1 then
+            redis.call("expire", KEYS[3], ARGV[3])
+        elseif count >= tonumber(ARGV[4]) then
+            redis.call("hset", KEYS[2], ARGV[2], 1)
+            redis.call("del", KEYS[3])
+        end
+        return {2, species}
+    """,
+    # Removes the wild pokemon in a channel if it's still the given species. Returns 1 for the one caller that
+    # removed it and 0 for everyone else.
+    # KEYS: wild; ARGV: channel id, species id
+    "claim_wild": """
+        if redis.call("hget", KEYS[1], ARGV[1]) == ARGV[2] then
+            return redis.call("hdel", KEYS[1], ARGV[1])
+        end
+        return 0
+    """,
+    # Claims members of sorted sets used as schedules whose time has come, by pushing their score forward to the
+    # end of a lease. A claimer that dies without removing or rescheduling a member leaves it to be claimed again
+    # once the lease runs out. Returns a flat list of key, member pairs.
+    # KEYS: schedules; ARGV: now, lease end, max claims per key
+    "claim_due": """
+        local claimed = {}
+        for _, key in ipairs(KEYS) do
+            local members = redis.call("zrangebyscore", key, "-inf", ARGV[1], "LIMIT", 0, ARGV[3])
+            for _, member in ipairs(members) do
+                redis.call("zadd", key, ARGV[2], member)
+                table.insert(claimed, key)
+                table.insert(claimed, member)
+            end
+        end
+        return claimed
+    """,
+    # Saves a trade session if its revision is still the one the caller loaded, and points both users at it. A trade
+    # can't be saved for a user who is in a different one, which also keeps a user from starting two trades at once.
+    # KEYS: trade:session:<id>, trade:user:<id> for each user; ARGV: expected revision, data, ttl, trade id
+    "save_trade": """
+        local revision = tonumber(redis.call("hget", KEYS[1], "revision") or 0)
+        if revision ~= tonumber(ARGV[1]) then
+            return 0
+        end
+        for i = 2, #KEYS do
+            local owner = redis.call("get", KEYS[i])
+            if owner and owner ~= ARGV[4] then
+                return 0
+            end
+        end
+        redis.call("hset", KEYS[1], "revision", revision + 1, "data", ARGV[2])
+        redis.call("expire", KEYS[1], ARGV[3])
+        for i = 2, #KEYS do
+            redis.call("set", KEYS[i], ARGV[4], "EX", ARGV[3])
+        end
+        return 1
+    """,
+    # Deletes a trade session along with the users' pointers to it. Returns 1 if the session still existed.
+    # KEYS: trade:session:<id>, trade:user:<id> for each user; ARGV: trade id
+    "end_trade": """
+        for i = 2, #KEYS do
+            if redis.call("get", KEYS[i]) == ARGV[1] then
+                redis.call("del", KEYS[i])
+            end
+        end
+        return redis.call("del", KEYS[1])
+    """,
+}
+
+SCRIPT_DIGESTS = {k: hashlib.sha1(v.encode()).hexdigest() for k, v in SCRIPTS.items()}
+
+# Messages sent between clusters with send_message. Each type names the cog method that handles it and the fields it
+# carries, which are passed to the handler as keyword arguments. Messages are JSON, so fields must be plain data.
+#
+# Services outside the bot can send messages too by pushing onto rpc:any (or rpc:<cluster idx>) a JSON object like
+#   {"type": "send_dm", "from": null, "sent": <unix time>, "data": {"user_id": 123, "content": "Hi"}}
+# This replaces the old send_dm list of pickled (user id, content) tuples. Until every producer has moved over, that
+# list is still drained into the DM queue while LEGACY_SEND_DM is on.
+
+MESSAGE_TYPES = {
+    "send_dm": {"cog": "Bot", "handler": "handle_send_dm", "fields": ("user_id", "content")},
+    "battle_move": {"cog": "Battling", "handler": "handle_battle_move", "fields": ("user_id", "move")},
+}
+
 
 class Redis(commands.Cog):
     """For redis."""
@@ -10,8 +114,128 @@ class Redis(commands.Cog):
         self.pool = None
         self._connect_task = self.bot.loop.create_task(self.connect())
 
+        # Every cluster reads its own rpc:<cluster idx> list and the shared rpc:any list with a single BLPOP, and
+        # handles each message in its own task so a slow handler doesn't hold up the rest.
+
+        self.bus_stats = StatsCounter()
+        self.bus_latency = {}
+        self._consume_task = self.bot.loop.create_task(self.consume())
+
     async def connect(self):
         self.pool = await aioredis.create_redis_pool(**self.bot.config.REDIS_CONF)
+        for script in SCRIPTS.values():
+            await self.pool.script_load(script)
+
+    async def run_script(self, name, keys=(), args=()):
+        try:
+            return await self.pool.evalsha(SCRIPT_DIGESTS[name], keys=keys, args=args)
+        except aioredis.ReplyError as e:
+            # The script cache is emptied when the server restarts or SCRIPT FLUSH is run
+            if not str(e).startswith("NOSCRIPT"):
+                raise
+            await self.pool.script_load(SCRIPTS[name])
+            return await self.pool.evalsha(SCRIPT_DIGESTS[name], keys=keys, args=args)
+
+    @staticmethod
+    def inbox(cluster_idx=None):
+        return "rpc:any" if cluster_idx is None else f"rpc:{cluster_idx}"
+
+    async def send_message(self, kind, cluster_idx=None, **data):
+        # Sends to one cluster, or to whichever cluster gets to it first if cluster_idx is None
+
+        if data.keys() != set(MESSAGE_TYPES[kind]["fields"]):
+            raise ValueError(f"{kind} messages take {', '.join(MESSAGE_TYPES[kind]['fields'])}")
+
+        # Lists are capped and expire, so messages for a cluster that's down don't pile up forever
+
+        message = {"type": kind, "from": self.bot.cluster_idx, "sent": time.time(), "data": data}
+        inbox = self.inbox(cluster_idx)
+        tr = self.pool.multi_exec()
+        tr.rpush(inbox, json.dumps(message))
+        tr.ltrim(inbox, -getattr(self.bot.config, "RPC_MAX_BACKLOG", 10000), -1)
+        tr.expire(inbox, getattr(self.bot.config, "RPC_BACKLOG_TTL", 300))
+        await tr.execute()
+        self.bus_stats["sent"] += 1
+
+    async def consume(self):
+        await self.wait_until_ready()
+        await self.bot.wait_until_ready()
+
+        legacy = ("send_dm",) if getattr(self.bot.config, "LEGACY_SEND_DM", True) else ()
+        delay = 1
+        while True:
+            try:
+                with await self.pool as r:
+                    while True:
+                        key, raw = await r.blpop(self.inbox(self.bot.cluster_idx), self.inbox(), *legacy)
+                        delay = 1
+                        if key == b"send_dm":
+                            self.handle_legacy_dm(raw)
+                            continue
+                        message = self.parse_message(raw)
+                        if message is not None:
+                            self.bot.loop.create_task(self.handle_message(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Most likely the connection dropped. It's replaced by the pool on the next attempt.
+                self.bot.log.exception(f"Message bus consumer failed, retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    def handle_legacy_dm(self, raw):
+        try:
+            user_id, content = pickle.loads(raw)
+        except Exception as e:
+            self.bus_stats["malformed"] += 1
+            self.bot.log.warning(f"Dropping malformed send_dm entry: {e}")
+            return
+        self.bus_stats["legacy"] += 1
+        self.bot.queue_dm(user_id, content)
+
+    def parse_message(self, raw):
+        # Returns the message, or None if it's malformed or of an unknown type, in which case it's dropped
+
+        try:
+            message = json.loads(raw)
+            kind = message["type"]
+            if not isinstance(message["data"], dict) or not isinstance(message["sent"], (int, float)):
+                raise ValueError("data must be an object and sent a number")
+            if kind not in MESSAGE_TYPES:
+                raise ValueError(f"unknown type {kind!r}")
+            elif message["data"].keys() != set(MESSAGE_TYPES[kind]["fields"]):
+                raise ValueError(f"{kind} messages take {', '.join(MESSAGE_TYPES[kind]['fields'])}")
+        except (ValueError, KeyError, TypeError) as e:
+            self.bus_stats["malformed"] += 1
+            self.bot.log.warning(f"Dropping malformed message: {e}")
+            return None
+
+        message.setdefault("from", None)
+        return message
+
+    async def handle_message(self, message):
+        kind = message["type"]
+        self.bus_stats["received"] += 1
+
+        count, total, worst = self.bus_latency.get(kind, (0, 0, 0))
+        latency = time.time() - message["sent"]
+        self.bus_latency[kind] = (count + 1, total + latency, max(worst, latency))
+
+        try:
+            spec = MESSAGE_TYPES[kind]
+            handler = getattr(self.bot.get_cog(spec["cog"]), spec["handler"])
+            await handler(**message["data"])
+        except Exception:
+            self.bus_stats["failed"] += 1
+            self.bot.log.exception(f"Failed to handle {kind} message from cluster {message['from']}")
+
+    async def fetch_backlog(self):
+        # The number of messages waiting for this cluster and for any cluster
+
+        tr = self.pool.multi_exec()
+        tr.llen(self.inbox(self.bot.cluster_idx))
+        tr.llen(self.inbox())
+        return await tr.execute()
 
     async def close(self):
         self.pool.close()
@@ -21,6 +245,7 @@ class Redis(commands.Cog):
         await self._connect_task
 
     def cog_unload(self):
+        self._consume_task.cancel()
         self.bot.loop.create_task(self.close())
 
 
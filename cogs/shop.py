@@ -68,7 +68,7 @@ class Shop(commands.Cog):
     async def vote(self, ctx):
         """View information on voting rewards."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         # if member.vote_streak > 0 and datetime.utcnow() - member.last_voted > timedelta(
         #     days=2
@@ -79,7 +79,7 @@ class Shop(commands.Cog):
         #             "$set": {"vote_streak": 0},
         #         },
         #     )
-        #     member = await self.bot.mongo.fetch_member_info(ctx.author)
+        #     member = await ctx.fetch_member_info()
 
         do_emojis = ctx.guild is None or ctx.channel.permissions_for(ctx.guild.me).external_emojis
 
@@ -165,7 +165,7 @@ class Shop(commands.Cog):
             else:
                 return await ctx.send("Please type `normal`, `great`, `ultra`, or `master`!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if amt <= 0:
             return await ctx.send("Nice try...")
@@ -262,7 +262,7 @@ class Shop(commands.Cog):
 
         embed.add_field(name="Rewards Received", value="\n".join(text))
 
-        await self.bot.mongo.update_member(ctx.author, update)
+        await ctx.update_member(update)
         if len(added_pokemon) > 0:
             await self.bot.mongo.db.pokemon.insert_many(added_pokemon)
         self.bot.dispatch("open_box", ctx.author, amt)
@@ -273,7 +273,7 @@ class Shop(commands.Cog):
     async def balance(self, ctx):
         """View your current balance."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         embed = self.bot.Embed(title=f"{ctx.author.display_name}'s balance")
         embed.add_field(name="Pokécoins", value=f"{member.balance:,}")
@@ -357,9 +357,9 @@ class Shop(commands.Cog):
     async def togglebalance(self, ctx):
         """Toggle showing balance in shop."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
-        await self.bot.mongo.update_member(ctx.author, {"$set": {"show_balance": not member.show_balance}})
+        await ctx.update_member({"$set": {"show_balance": not member.show_balance}})
 
         if member.show_balance:
             await ctx.send(f"Your balance is now hidden in shop pages.")
@@ -371,7 +371,7 @@ class Shop(commands.Cog):
     async def shop(self, ctx, *, page: int = 0):
         """View the Pokétwo item shop."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         embed = self.bot.Embed(title=f"Pokétwo Shop")
 
@@ -484,7 +484,7 @@ class Shop(commands.Cog):
         if item is None:
             return await ctx.send(f"Couldn't find an item called `{' '.join(args)}`.")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
         pokemon = await self.bot.mongo.fetch_pokemon(ctx.author, member.selected_id)
 
         if pokemon is None:
@@ -647,13 +647,12 @@ class Shop(commands.Cog):
 
         # OK to buy, go ahead
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if (member.premium_balance if item.shard else member.balance) < item.cost * qty:
             return await ctx.send(f"You don't have enough {'shards' if item.shard else 'Pokécoins'} for that!")
 
-        await self.bot.mongo.update_member(
-            ctx.author,
+        await ctx.update_member(
             {
                 "$inc": {
                     "premium_balance" if item.shard else "balance": -item.cost * qty,
@@ -662,11 +661,10 @@ class Shop(commands.Cog):
         )
 
         if item.action == "shard":
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"premium_balance": qty}})
+            await ctx.update_member({"$inc": {"premium_balance": qty}})
 
         if item.action == "redeem":
-            await self.bot.mongo.update_member(
-                ctx.author,
+            await ctx.update_member(
                 {
                     "$inc": {
                         "redeems": qty,
@@ -675,8 +673,7 @@ class Shop(commands.Cog):
             )
 
         if item.action == "shiny_charm":
-            await self.bot.mongo.update_member(
-                ctx.author,
+            await ctx.update_member(
                 {
                     "$set": {"shiny_charm_expires": datetime.utcnow() + timedelta(weeks=1)},
                 },
@@ -686,7 +683,6 @@ class Shop(commands.Cog):
             await self.bot.mongo.update_channel(
                 ctx.channel,
                 {
-                    "$set": {"guild_id": ctx.guild.id},
                     "$inc": {"spawns_remaining": 180},
                 },
             )
@@ -713,8 +709,7 @@ class Shop(commands.Cog):
         if "xpboost" in item.action:
             mins = int(item.action.split("_")[1])
 
-            await self.bot.mongo.update_member(
-                ctx.author,
+            await ctx.update_member(
                 {
                     "$set": {"boost_expires": datetime.utcnow() + timedelta(minutes=mins)},
                 },
@@ -853,7 +848,7 @@ class Shop(commands.Cog):
     async def redeem(self, ctx):
         """Use a redeem to receive a pokémon of your choice."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         embed = self.bot.Embed(
             title=f"Your Redeems: {member.redeems}",
@@ -877,7 +872,7 @@ class Shop(commands.Cog):
 
         # TODO I should really merge this and redeem into one function.
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if species is None:
             embed = self.bot.Embed(
@@ -907,8 +902,7 @@ class Shop(commands.Cog):
             return await ctx.send("You can't redeemspawn a pokémon here!")
 
         if await self.bot.get_cog("Spawning").spawn_pokemon(ctx.channel, species, redeem=True):
-            await self.bot.mongo.update_member(
-                ctx.author,
+            await ctx.update_member(
                 {"$inc": {"redeems": -1}},
             )
 
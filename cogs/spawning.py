@@ -1,25 +1,32 @@
 import asyncio
 import io
+import os
 import random
 import time
-from collections import defaultdict
+from collections import OrderedDict
 from urllib.parse import urljoin
 
 import aiohttp
 import discord
 from discord.ext import commands, tasks
 from helpers import checks
+from helpers.utils import GenerationalDict
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from data import models
 
-from . import mongo
 
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
 
-def write_fp(data):
-    arr = io.BytesIO()
-    arr.write(data)
-    arr.seek(0)
-    return arr
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
 
 
 class Spawning(commands.Cog):
@@ -28,127 +35,254 @@ class Spawning(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-        self.caught_users = defaultdict(list)
-        self.bot.cooldown_users = {}
-        self.bot.cooldown_guilds = {}
+        # Only channels where a spawn can be caught more than once keep track of who has caught it
+
+        self.caught_users = {}
+
+        # Cooldown timestamps only matter for a few seconds and message counts toward a spawn are allowed to lapse
+        # in guilds that go quiet, so idle keys are dropped rather than kept for the life of the process.
+
+        self.bot.cooldown_users = GenerationalDict(getattr(self.bot.config, "COOLDOWN_GENERATION_PERIOD", 60))
+        self.bot.cooldown_guilds = GenerationalDict(getattr(self.bot.config, "COOLDOWN_GENERATION_PERIOD", 60))
+
+        self.xp_buffer = {}
+
+        # Spawn images, keyed by (species id, "day" / "night", or None for the bundled image). The least recently
+        # used are evicted past the byte budget, and images from the image server are also kept on disk if a
+        # directory is configured. Concurrent requests for the same image share one load.
+
+        self.images = OrderedDict()
+        self.images_size = 0
+        self.image_requests = {}
 
         self.spawn_incense.start()
+        self.flush_xp.change_interval(seconds=getattr(self.bot.config, "XP_FLUSH_INTERVAL", 30))
+        self.flush_xp.start()
 
         if not hasattr(self.bot, "guild_counter"):
-            self.bot.guild_counter = {}
+            self.bot.guild_counter = GenerationalDict(getattr(self.bot.config, "GUILD_COUNTER_GENERATION_PERIOD", 3600))
 
     @tasks.loop(seconds=20)
     async def spawn_incense(self):
-        channels = self.bot.mongo.db.channel.find({"spawns_remaining": {"$gt": 0}})
+        channels = self.bot.mongo.db.channel.find(
+            {"spawns_remaining": {"$gt": 0}, **self.bot.mongo.local_shard_filter()}
+        )
+
+        ops = []
         async for result in channels:
             guild = self.bot.get_guild(result["guild_id"])
             channel = None if guild is None else guild.get_channel_or_thread(result["_id"])
 
             if channel is not None:
                 self.bot.loop.create_task(self.spawn_pokemon(channel, incense=result["spawns_remaining"]))
-                await self.bot.mongo.update_channel(channel, {"$inc": {"spawns_remaining": -1}})
+                ops.append(UpdateOne({"_id": channel.id}, {"$inc": {"spawns_remaining": -1}}))
+
+        if len(ops) > 0:
+            await self.bot.mongo.db.channel.bulk_write(ops, ordered=False)
 
     @spawn_incense.before_loop
     async def before_spawn_incense(self):
         await self.bot.wait_until_ready()
+        await self.bot.mongo.refresh_shard_ids("channel")
+
+    async def fetch_spawn_image(self, species, time_of_day):
+        key = (species.id, time_of_day)
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key]
+
+        if key not in self.image_requests:
+            task = self.bot.loop.create_task(self.load_spawn_image(species, time_of_day))
+            task.add_done_callback(lambda _: self.image_requests.pop(key, None))
+            self.image_requests[key] = task
+
+        return await asyncio.shield(self.image_requests[key])
+
+    async def load_spawn_image(self, species, time_of_day):
+        if time_of_day is None:
+            data = await self.bot.loop.run_in_executor(None, read_file, f"data/images/{species.id}.png")
+        else:
+            data = None
+            path = None
+            if (directory := getattr(self.bot.config, "SPAWN_IMAGE_CACHE_DIR", None)) is not None:
+                path = os.path.join(directory, f"{species.id}-{time_of_day}.jpg")
+                if os.path.exists(path):
+                    data = await self.bot.loop.run_in_executor(None, read_file, path)
+
+            if data is None:
+                url = urljoin(self.bot.config.SERVER_URL, f"image?species={species.id}&time={time_of_day}")
+                async with self.bot.http_session.get(url) as resp:
+                    if resp.status != 200:
+                        return None
+                    data = await resp.read()
+                if path is not None:
+                    await self.bot.loop.run_in_executor(None, write_file, path, data)
+
+        key = (species.id, time_of_day)
+        if key in self.images:
+            self.images_size -= len(self.images[key])
+        self.images[key] = data
+        self.images_size += len(data)
+        budget = getattr(self.bot.config, "SPAWN_IMAGE_CACHE_BYTES", 128 * 1024 * 1024)
+        while self.images_size > budget and len(self.images) > 1:
+            _, evicted = self.images.popitem(last=False)
+            self.images_size -= len(evicted)
+
+        return data
+
+    @tasks.loop(seconds=30)
+    async def flush_xp(self):
+        await self.flush_xp_buffer()
+
+    @flush_xp.before_loop
+    async def before_flush_xp(self):
+        await self.bot.wait_until_ready()
+
+    async def flush_xp_buffer(self):
+        # Swapping the buffer out also drops the cached pokemon, so they are re-read at most once per interval.
+
+        # Writes that fail are merged back into the buffer to be retried on the next flush.
+
+        buffer, self.xp_buffer = self.xp_buffer, {}
+        keys = [k for k, v in buffer.items() if v["xp"] > 0]
+        ops = [
+            UpdateOne(
+                {"_id": k, "owner_id": buffer[k]["pokemon"].owner_id, "owned_by": "user"},
+                {"$inc": {"xp": buffer[k]["xp"]}},
+            )
+            for k in keys
+        ]
+        batch_size = getattr(self.bot.config, "XP_FLUSH_BATCH_SIZE", 1000)
+        failed = []
+        for i in range(0, len(ops), batch_size):
+            try:
+                await self.bot.mongo.db.pokemon.bulk_write(ops[i : i + batch_size], ordered=False)
+            except BulkWriteError as e:
+                failed += [keys[i + x["index"]] for x in e.details["writeErrors"]]
+            except Exception:
+                self.bot.log.exception("Failed to flush buffered XP")
+                failed += keys[i : i + batch_size]
+
+        if len(failed) > 0:
+            self.bot.log.warning(f"Failed to flush buffered XP for {len(failed)} pokemon, retrying next flush")
+        for k in failed:
+            if k in self.xp_buffer:
+                self.xp_buffer[k]["xp"] += buffer[k]["xp"]
+            else:
+                self.xp_buffer[k] = buffer[k]
 
     async def increase_xp(self, message):
         member = await self.bot.mongo.fetch_member_info(message.author)
 
-        if member is not None:
-            if member.suspended:
-                return
-
-            silence = member.silence
-            if message.guild:
-                guild = await self.bot.mongo.fetch_guild(message.guild)
-                silence = silence or guild and guild.silence
+        if member is None or member.suspended:
+            return
 
+        entry = self.xp_buffer.get(member.selected_id)
+        if entry is None:
             pokemon = await self.bot.mongo.fetch_pokemon(message.author, member.selected_id)
-            if pokemon is not None and pokemon.held_item != 13002:
+            if pokemon is None:
+                return
+            entry = self.xp_buffer[pokemon.id] = {"pokemon": pokemon, "xp": 0}
 
-                # TODO this stuff here needs to be refactored
+        pokemon = entry["pokemon"]
 
-                if pokemon.level < 100 and pokemon.xp < pokemon.max_xp:
-                    xp_inc = random.randint(10, 40)
+        if pokemon.held_item == 13002:
+            return
 
-                    if member.boost_active or message.guild.id == 716390832034414685:
-                        xp_inc *= 2
-                    pokemon.xp += xp_inc
+        if pokemon.level == 100:
+            if pokemon.xp < pokemon.max_xp:
+                pokemon.xp = pokemon.max_xp
+                await self.bot.mongo.update_pokemon(pokemon, {"$set": {"xp": pokemon.max_xp}})
+            return
 
-                    await self.bot.mongo.update_pokemon(pokemon, {"$inc": {"xp": xp_inc}})
+        xp_inc = random.randint(10, 40)
 
-                if pokemon.xp >= pokemon.max_xp and pokemon.level < 100:
-                    update = {"$set": {f"xp": 0, f"level": pokemon.level + 1}}
-                    embed = self.bot.Embed(title=f"Congratulations {message.author.display_name}!")
+        if member.boost_active or message.guild.id == 716390832034414685:
+            xp_inc *= 2
 
-                    name = str(pokemon.species)
+        # Buffer the XP until it would cross a level-up threshold, then settle it on the fresh document
 
-                    if pokemon.nickname is not None:
-                        name += f' "{pokemon.nickname}"'
+        if pokemon.xp + entry["xp"] + xp_inc < pokemon.max_xp:
+            entry["xp"] += xp_inc
+            return
 
-                    embed.description = f"Your {name} is now level {pokemon.level + 1}!"
+        xp_inc += entry["xp"]
+        del self.xp_buffer[pokemon.id]
 
-                    if pokemon.shiny:
-                        embed.set_thumbnail(url=pokemon.species.shiny_image_url)
-                    else:
-                        embed.set_thumbnail(url=pokemon.species.image_url)
+        pokemon = await self.bot.mongo.fetch_pokemon(message.author, pokemon.id)
+        if pokemon is None or pokemon.held_item == 13002 or pokemon.level == 100:
+            return
 
-                    pokemon.level += 1
-                    guild = await self.bot.mongo.fetch_guild(message.channel.guild)
-                    if pokemon.get_next_evolution(guild.is_day) is not None:
-                        evo = pokemon.get_next_evolution(guild.is_day)
-                        embed.add_field(
-                            name=f"Your {name} is evolving!",
-                            value=f"Your {name} has turned into a {evo}!",
-                        )
+        if pokemon.xp + xp_inc < pokemon.max_xp:
+            await self.bot.mongo.update_pokemon(pokemon, {"$inc": {"xp": xp_inc}})
+            return
 
-                        if pokemon.shiny:
-                            embed.set_thumbnail(url=evo.shiny_image_url)
-                        else:
-                            embed.set_thumbnail(url=evo.image_url)
+        silence = member.silence
+        if message.guild:
+            guild = await self.bot.mongo.fetch_guild(message.guild)
+            silence = silence or guild and guild.silence
 
-                        update["$set"][f"species_id"] = evo.id
+        update = {"$set": {f"xp": 0, f"level": pokemon.level + 1}}
+        embed = self.bot.Embed(title=f"Congratulations {message.author.display_name}!")
 
-                        self.bot.dispatch("evolve", message.author, pokemon, evo)
+        name = str(pokemon.species)
 
-                    else:
-                        c = 0
-                        for move in pokemon.species.moves:
-                            if move.method.level == pokemon.level:
-                                embed.add_field(
-                                    name=f"New move!",
-                                    value=f"Your {name} can now learn {move.move.name}!",
-                                )
-                                c += 1
+        if pokemon.nickname is not None:
+            name += f' "{pokemon.nickname}"'
 
-                        for i in range(-c % 3):
-                            embed.add_field(
-                                name="‎",
-                                value="‎",
-                            )
+        embed.description = f"Your {name} is now level {pokemon.level + 1}!"
 
-                    await self.bot.mongo.update_pokemon(pokemon, update)
+        if pokemon.shiny:
+            embed.set_thumbnail(url=pokemon.species.shiny_image_url)
+        else:
+            embed.set_thumbnail(url=pokemon.species.image_url)
 
-                    if not silence:
-                        permissions = message.channel.permissions_for(message.guild.me)
-                        if permissions.send_messages and permissions.attach_files and permissions.embed_links:
-                            await message.channel.send(embed=embed)
+        pokemon.level += 1
+        if pokemon.get_next_evolution(guild.is_day) is not None:
+            evo = pokemon.get_next_evolution(guild.is_day)
+            embed.add_field(
+                name=f"Your {name} is evolving!",
+                value=f"Your {name} has turned into a {evo}!",
+            )
 
-                    if silence and pokemon.level == 100:
-                        await message.author.send(embed=embed)
+            if pokemon.shiny:
+                embed.set_thumbnail(url=evo.shiny_image_url)
+            else:
+                embed.set_thumbnail(url=evo.image_url)
 
-                elif pokemon.level == 100 and pokemon.xp < pokemon.max_xp:
-                    await self.bot.mongo.update_pokemon(pokemon, {"$set": {"xp": pokemon.max_xp}})
+            update["$set"][f"species_id"] = evo.id
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot or message.guild is None:
-            return
+            self.bot.dispatch("evolve", message.author, pokemon, evo)
 
-        ctx = await self.bot.get_context(message)
+        else:
+            c = 0
+            for move in pokemon.species.moves:
+                if move.method.level == pokemon.level:
+                    embed.add_field(
+                        name=f"New move!",
+                        value=f"Your {name} can now learn {move.move.name}!",
+                    )
+                    c += 1
+
+            for i in range(-c % 3):
+                embed.add_field(
+                    name="‎",
+                    value="‎",
+                )
+
+        await self.bot.mongo.update_pokemon(pokemon, update)
+
+        if not silence:
+            permissions = message.channel.permissions_for(message.guild.me)
+            if permissions.send_messages and permissions.attach_files and permissions.embed_links:
+                await message.channel.send(embed=embed)
+
+        if silence and pokemon.level == 100:
+            await message.author.send(embed=embed)
 
-        if ctx.valid:
+    @commands.Cog.listener()
+    async def on_message_without_command(self, message: discord.Message):
+        if message.guild is None:
             return
 
         current = time.time()
@@ -234,23 +368,23 @@ class Spawning(commands.Cog):
 
         image = None
 
+        # BytesIO shares the cached bytes rather than copying them until something writes to it
+
         if hasattr(self.bot.config, "SERVER_URL"):
-            url = urljoin(self.bot.config.SERVER_URL, f"image?species={species.id}&time=")
-            url += "day" if guild.is_day else "night"
-            async with self.bot.http_session.get(url) as resp:
-                if resp.status == 200:
-                    arr = await self.bot.loop.run_in_executor(None, write_fp, await resp.read())
-                    image = discord.File(arr, filename="pokemon.jpg")
-                    embed.set_image(url="attachment://pokemon.jpg")
+            data = await self.fetch_spawn_image(species, "day" if guild.is_day else "night")
+            if data is not None:
+                image = discord.File(io.BytesIO(data), filename="pokemon.jpg")
+                embed.set_image(url="attachment://pokemon.jpg")
 
         if image is None:
-            image = discord.File(f"data/images/{species.id}.png", filename="pokemon.png")
+            data = await self.fetch_spawn_image(species, None)
+            image = discord.File(io.BytesIO(data), filename="pokemon.png")
             embed.set_image(url="attachment://pokemon.png")
 
         if incense:
             embed.set_footer(text=f"Incense: Active.\nSpawns Remaining: {incense-1}.")
 
-        self.caught_users[channel.id] = set()
+        self.caught_users.pop(channel.id, None)
         await self.bot.redis.hset("wild", channel.id, species.id)
 
         if redeem:
@@ -264,6 +398,25 @@ class Spawning(commands.Cog):
 
         return True
 
+    async def check_wild(self, ctx):
+        # Returns the wild species in the channel, or None if there isn't one or the user has to solve a captcha.
+        # Either way the attempt counts toward the captcha threshold, all in one round trip.
+
+        result = await self.bot.get_cog("Redis").run_script(
+            "check_wild",
+            keys=["wild", "captcha", f"catches:{ctx.author.id}"],
+            args=[ctx.channel.id, ctx.author.id, 86400, 1000],
+        )
+
+        if result[0] == 1:
+            await ctx.send(
+                f"Whoa there. Please tell us you're human! https://verify.poketwo.net/captcha/{ctx.author.id}"
+            )
+        if result[0] != 2:
+            return None
+
+        return self.bot.data.species_by_number(int(result[1]))
+
     @checks.has_started()
     @commands.cooldown(1, 10, commands.BucketType.channel)
     @commands.cooldown(1, 20, commands.BucketType.user)
@@ -271,24 +424,10 @@ class Spawning(commands.Cog):
     async def hint(self, ctx):
         """Get a hint for the wild pokémon."""
 
-        if not await self.bot.redis.hexists("wild", ctx.channel.id):
+        species = await self.check_wild(ctx)
+        if species is None:
             return
 
-        if await self.bot.redis.hexists("captcha", ctx.author.id):
-            return await ctx.send(
-                f"Whoa there. Please tell us you're human! https://verify.poketwo.net/captcha/{ctx.author.id}"
-            )
-
-        count = await self.bot.redis.hincrby(f"catches:{ctx.author.id}", 1)
-        if count == 1:
-            await self.bot.redis.expire(f"catches:{ctx.author.id}", 86400)
-        elif count >= 1000:
-            await self.bot.redis.hset("captcha", ctx.author.id, 1)
-            await self.bot.redis.delete(f"catches:{ctx.author.id}")
-
-        species_id = await self.bot.redis.hget("wild", ctx.channel.id)
-        species = self.bot.data.species_by_number(int(species_id))
-
         inds = [i for i, x in enumerate(species.name) if x.isalpha()]
         blanks = random.sample(inds, len(inds) // 2)
         hint = "".join("\\_" if i in blanks else x for i, x in enumerate(species.name))
@@ -296,128 +435,56 @@ class Spawning(commands.Cog):
         await ctx.send(f"The pokémon is {hint}.")
 
     @checks.has_started()
-    @commands.max_concurrency(1, commands.BucketType.channel, wait=True)
     @commands.command(aliases=("c",))
     async def catch(self, ctx, *, guess: str):
         """Catch a wild pokémon."""
 
-        # Retrieve correct species and level from tracker
+        # Guesses are checked concurrently; only the first correct one in a channel gets to claim the pokemon.
 
-        if not await self.bot.redis.hexists("wild", ctx.channel.id):
+        species = await self.check_wild(ctx)
+        if species is None:
             return
 
-        if await self.bot.redis.hexists("captcha", ctx.author.id):
-            return await ctx.send(
-                f"Whoa there. Please tell us you're human! https://verify.poketwo.net/captcha/{ctx.author.id}"
-            )
-
-        count = await self.bot.redis.hincrby(f"catches:{ctx.author.id}", 1)
-        if count == 1:
-            await self.bot.redis.expire(f"catches:{ctx.author.id}", 86400)
-        elif count >= 1000:
-            await self.bot.redis.hset("captcha", ctx.author.id, 1)
-            await self.bot.redis.delete(f"catches:{ctx.author.id}")
-
-        species_id = await self.bot.redis.hget("wild", ctx.channel.id)
-        species = self.bot.data.species_by_number(int(species_id))
-
         if models.deaccent(guess.lower().replace("′", "'")) not in species.correct_guesses:
             return await ctx.send("That is the wrong pokémon!")
 
         # Correct guess, add to database
 
         if ctx.channel.id == 759559123657293835:
-            if ctx.author.id in self.caught_users[ctx.channel.id]:
+            caught_users = self.caught_users.setdefault(ctx.channel.id, set())
+            if ctx.author.id in caught_users:
                 return await ctx.send("You have already caught this pokémon!")
 
-            self.caught_users[ctx.channel.id].add(ctx.author.id)
-        else:
-            await self.bot.redis.hdel("wild", ctx.channel.id)
-
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
-
-        shiny = member.determine_shiny(species)
-        level = min(max(int(random.normalvariate(20, 10)), 1), 100)
-        moves = [x.move.id for x in species.moves if level >= x.method.level]
-        random.shuffle(moves)
-
-        ivs = [mongo.random_iv() for i in range(6)]
-
-        await self.bot.mongo.db.pokemon.insert_one(
-            {
-                "owner_id": ctx.author.id,
-                "owned_by": "user",
-                "species_id": species.id,
-                "level": level,
-                "xp": 0,
-                "nature": mongo.random_nature(),
-                "iv_hp": ivs[0],
-                "iv_atk": ivs[1],
-                "iv_defn": ivs[2],
-                "iv_satk": ivs[3],
-                "iv_sdef": ivs[4],
-                "iv_spd": ivs[5],
-                "iv_total": sum(ivs),
-                "moves": moves[:4],
-                "shiny": shiny,
-                "idx": await self.bot.mongo.fetch_next_idx(ctx.author),
-            }
-        )
-        if shiny:
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"shinies_caught": 1}})
-
-        message = f"Congratulations {ctx.author.mention}! You caught a level {level} {species}!"
-
-        memberp = await self.bot.mongo.fetch_pokedex(ctx.author, species.dex_number, species.dex_number + 1)
-
-        if str(species.dex_number) not in memberp.pokedex:
-            message += " Added to Pokédex. You received 35 Pokécoins!"
-
-            await self.bot.mongo.update_member(
-                ctx.author,
-                {
-                    "$set": {f"pokedex.{species.dex_number}": 1},
-                    "$inc": {"balance": 35},
-                },
-            )
-
-        else:
-            inc_bal = 0
-
-            if memberp.pokedex[str(species.dex_number)] + 1 == 10:
-                message += f" This is your 10th {self.bot.data.species_by_number(species.dex_number)}! You received 350 Pokécoins."
-                inc_bal = 350
+            caught_users.add(ctx.author.id)
+        elif not await self.bot.get_cog("Redis").run_script(
+            "claim_wild", keys=["wild"], args=[ctx.channel.id, species.id]
+        ):
+            return
 
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 100:
-                message += f" This is your 100th {self.bot.data.species_by_number(species.dex_number)}! You received 3,500 Pokécoins."
-                inc_bal = 3500
+        quests = self.bot.get_cog("Quests")
+        tracks = {} if quests is None else quests.get_catch_tracks(species, await ctx.fetch_member_info())
+        result = await self.bot.mongo.commit_catch(ctx.author, species, tracks)
 
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 1000:
-                message += f" This is your 1,000th {self.bot.data.species_by_number(species.dex_number)}! You received 35,000 Pokécoins."
-                inc_bal = 35000
+        if result is None:
+            return
 
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 10000:
-                message += f" This is your 10,000th {self.bot.data.species_by_number(species.dex_number)}! You received 350,000 Pokécoins."
-                inc_bal = 350000
+        member = result["member"]
+        pokemon = result["pokemon"]
+        shiny = pokemon.shiny
+        count = result["pokedex_count"]
 
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 100000:
-                message += f" This is your 100,000th {self.bot.data.species_by_number(species.dex_number)}! You received 3,500,000 Pokécoins."
-                inc_bal = 3500000
+        message = f"Congratulations {ctx.author.mention}! You caught a level {pokemon.level} {species}!"
 
-            await self.bot.mongo.update_member(
-                ctx.author,
-                {
-                    "$inc": {"balance": inc_bal, f"pokedex.{species.dex_number}": 1},
-                },
-            )
+        if count == 1:
+            message += f" Added to Pokédex. You received {result['reward']} Pokécoins!"
+        elif result["reward"] > 0:
+            message += f" This is your {count:,}th {self.bot.data.species_by_number(species.dex_number)}! You received {result['reward']:,} Pokécoins."
 
         if member.shiny_hunt == species.dex_number:
             if shiny:
                 message += f"\n\nShiny streak reset. (**{member.shiny_streak + 1}**)"
-                await self.bot.mongo.update_member(ctx.author, {"$set": {"shiny_streak": 0}})
             else:
                 message += f"\n\n+1 Shiny chain! (**{member.shiny_streak + 1}**)"
-                await self.bot.mongo.update_member(ctx.author, {"$inc": {"shiny_streak": 1}})
 
         if shiny:
             message += "\n\nThese colors seem unusual... ✨"
@@ -430,13 +497,16 @@ class Spawning(commands.Cog):
         else:
             await ctx.send(message, allowed_mentions=discord.AllowedMentions.none())
 
+        if quests is not None:
+            await quests.send_completed(ctx, result["quests"])
+
     @checks.has_started()
     @commands.command()
     async def togglemention(self, ctx):
         """Toggle getting mentioned when catching a pokémon."""
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
-        await self.bot.mongo.update_member(ctx.author, {"$set": {"catch_mention": not member.catch_mention}})
+        await ctx.update_member({"$set": {"catch_mention": not member.catch_mention}})
 
         if member.catch_mention:
             await ctx.send(f"You will no longer receive catch pings.")
@@ -448,7 +518,7 @@ class Spawning(commands.Cog):
     async def shinyhunt(self, ctx, *, species: str = None):
         """Hunt for a shiny pokémon species."""
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if species is None:
             embed = self.bot.Embed(
@@ -489,8 +559,7 @@ class Spawning(commands.Cog):
             if result is False:
                 return await ctx.send("Aborted.")
 
-        await self.bot.mongo.update_member(
-            ctx.author,
+        await ctx.update_member(
             {
                 "$set": {"shiny_hunt": species.id, "shiny_streak": 0},
             },
@@ -498,9 +567,13 @@ class Spawning(commands.Cog):
 
         await ctx.send(f"You are now shiny hunting **{species}**.")
 
-    def cog_unload(self):
+    async def cog_unload(self):
+        # On shutdown the buffer was already flushed by ClusterBot.close; this covers reloading the cog
+
         self.spawn_incense.cancel()
-        self.send_spawns.cancel()
+        self.flush_xp.cancel()
+        if self.bot.mongo is not None:
+            await self.flush_xp_buffer()
 
 
 async def setup(bot: commands.Bot):
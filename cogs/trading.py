@@ -1,19 +1,21 @@
 import asyncio
 import math
 import random
+import time
 from datetime import datetime, timedelta
-from itertools import zip_longest
 
+import bson
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from helpers import checks, flags, pagination
+from helpers.trade import Trade
+from pymongo import UpdateOne
 
 from data.models import deaccent
 
 
-def chunks(lst, n):
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+class TradeFailed(Exception):
+    pass
 
 
 class Trading(commands.Cog):
@@ -22,18 +24,124 @@ class Trading(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         if not hasattr(self.bot, "trades"):
-            self.bot.loop.create_task(self.clear_trades())
-        self.process_cancel_trades.start()
+            self.bot.trades = {}
+        self._listen_task = self.bot.loop.create_task(self.listen_trades())
 
-    @tasks.loop(seconds=0.1)
-    async def process_cancel_trades(self):
-        with await self.bot.redis as r:
-            req = await r.blpop(f"cancel_trade:{self.bot.cluster_idx}")
-            await self.end_trade(int(req[1]))
+    # Trade sessions are stored in Redis, so a trade outlives the cluster it started on and can be picked up by
+    # whichever cluster handles its next command. bot.trades keeps the trades this cluster has loaded; clusters tell
+    # each other over pub/sub when a trade is saved or ended, and drop their copy.
+
+    async def listen_trades(self):
+        # Invalidations published while not subscribed are lost, so every (re)subscription forgets the loaded trades
+        # and they're loaded from Redis again on their next command.
 
-    @process_cancel_trades.before_loop
-    async def before_process_cancel_trades(self):
         await self.bot.wait_until_ready()
+        await self.bot.get_cog("Redis").wait_until_ready()
+
+        while True:
+            try:
+                (channel,) = await self.bot.redis.subscribe("trade:invalidate")
+                self.bot.trades.clear()
+                while await channel.wait_message():
+                    cluster_idx, trade_id = (await channel.get(encoding="utf-8")).split(":")
+                    if int(cluster_idx) != self.bot.cluster_idx:
+                        self.drop_trade(trade_id)
+                self.bot.log.warning("Unsubscribed from trade:invalidate, resubscribing")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.bot.log.exception("Lost subscription to trade:invalidate, resubscribing")
+            await asyncio.sleep(1)
+
+    def drop_trade(self, trade_id):
+        for user_id, trade in list(self.bot.trades.items()):
+            if trade.id == trade_id:
+                del self.bot.trades[user_id]
+                if trade.menu is not None:
+                    trade.menu.stop()
+
+    async def is_in_trade(self, user):
+        return await self.bot.redis.exists(f"trade:user:{user.id}")
+
+    async def fetch_trade(self, user_id):
+        if (trade := self.bot.trades.get(user_id)) is not None:
+            return trade
+
+        trade_id = await self.bot.redis.get(f"trade:user:{user_id}", encoding="utf-8")
+        if trade_id is None:
+            return None
+        revision, data = await self.bot.redis.hmget(f"trade:session:{trade_id}", "revision", "data")
+        if data is None:
+            return None
+
+        # A trade that was executing when its cluster went away can't safely be settled again. It stays marked as
+        # executing, and so can't be changed or canceled, until the session expires. Executing sessions are saved with
+        # a short lease (TRADE_EXECUTE_LEASE) so the users aren't stuck for long.
+
+        doc = bson.decode(data)
+        users = {}
+        for x in doc["sides"]:
+            users[x["user"]] = self.bot.get_user(x["user"]) or await self.bot.fetch_user(x["user"])
+        channel = self.bot.get_channel(doc["channel"]) or self.bot.get_partial_messageable(doc["channel"])
+        query = [{"_id": {"$in": x["pokemon"]}, "owner_id": x["user"]} for x in doc["sides"] if len(x["pokemon"]) > 0]
+        pokemon = {}
+        if len(query) > 0:
+            async for x in self.bot.mongo.db.pokemon.find({"$or": query, "owned_by": "user"}):
+                pokemon[x["_id"]] = self.bot.mongo.Pokemon.build_from_mongo(x)
+
+        trade = Trade.deserialize(trade_id, int(revision), doc, users, channel, pokemon)
+        for user in trade.users:
+            self.bot.trades[user.id] = trade
+        return trade
+
+    async def save_trade(self, trade):
+        # Returns whether the trade was saved. If it changed elsewhere since it was loaded, this copy is dropped so
+        # the next command loads it again.
+
+        if trade.executing:
+            ttl = getattr(self.bot.config, "TRADE_EXECUTE_LEASE", 300)
+        else:
+            ttl = getattr(self.bot.config, "TRADE_SESSION_TTL", 3600)
+
+        last_updated = trade.last_updated
+        trade.last_updated = datetime.utcnow()
+        saved = await self.bot.get_cog("Redis").run_script(
+            "save_trade",
+            keys=[f"trade:session:{trade.id}", *(f"trade:user:{x.id}" for x in trade.users)],
+            args=[trade.revision, trade.serialize(), ttl, trade.id],
+        )
+        if not saved:
+            trade.last_updated = last_updated
+            self.drop_trade(trade.id)
+            return False
+
+        trade.revision += 1
+        for user in trade.users:
+            self.bot.trades[user.id] = trade
+        await self.bot.redis.publish("trade:invalidate", f"{self.bot.cluster_idx}:{trade.id}")
+        return True
+
+    async def end_trade(self, user_id):
+        trade_id = await self.bot.redis.get(f"trade:user:{user_id}", encoding="utf-8")
+        if trade_id is None:
+            return False
+
+        if (trade := self.bot.trades.get(user_id)) is not None and trade.id == trade_id:
+            self.bot.dispatch("trade", trade)
+            user_ids = [x.id for x in trade.users]
+        elif (data := await self.bot.redis.hget(f"trade:session:{trade_id}", "data")) is not None:
+            user_ids = [x["user"] for x in bson.decode(data)["sides"]]
+        else:
+            user_ids = [user_id]
+
+        self.drop_trade(trade_id)
+        await self.bot.get_cog("Redis").run_script(
+            "end_trade",
+            keys=[f"trade:session:{trade_id}", *(f"trade:user:{x}" for x in user_ids)],
+            args=[trade_id],
+        )
+        await self.bot.redis.publish("trade:invalidate", f"{self.bot.cluster_idx}:{trade_id}")
+        return True
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -55,78 +163,183 @@ class Trading(commands.Cog):
                     "**Warning:** A trading embed by a bot pretending to be Pokétwo was identified and deleted for safety. Unattentive players are scammed using fake bots every day. Please make sure you are trading what you intended to."
                 )
 
-    async def clear_trades(self):
-        await self.bot.get_cog("Redis").wait_until_ready()
-        await self.bot.wait_until_ready()
+    async def execute_trade(self, ctx, trade):
+        # Settles a trade in a fixed number of round trips however many pokemon are in it. Every change is worked
+        # out in memory first, then the currency moves and pokemon updates are written together, in a transaction
+        # if they're enabled. Returns the trade evolution embeds, or None if it couldn't be settled.
 
-        todel = []
-        async for key, val in self.bot.redis.ihscan("trade"):
-            if int(val) == self.bot.cluster_idx:
-                todel.append(key)
-        if len(todel) > 0:
-            await self.bot.redis.hdel("trade", *todel)
+        a, b = trade.users
+        timings = {}
+        start = time.perf_counter()
 
-        self.bot.trades = {}
+        def phase(name):
+            nonlocal start
+            now = time.perf_counter()
+            timings[name] = round((now - start) * 1000, 1)
+            start = now
 
-    def is_in_trade(self, user):
-        return self.bot.redis.hexists("trade", user.id)
+        for u in trade.users:
+            member = await self.bot.mongo.fetch_member_info(u)
+            if member.balance < trade[u.id].pokecoins:
+                await ctx.send("The trade could not be executed as one user does not have enough Pokécoins.")
+                return None
+            if member.redeems < trade[u.id].redeems:
+                await ctx.send("The trade could not be executed as one user does not have enough redeems.")
+                return None
 
-    async def end_trade(self, user_id):
-        cluster_id = int(await self.bot.redis.hget("trade", user_id))
-        if cluster_id == self.bot.cluster_idx:
-            if user_id in self.bot.trades:
-                a, b = self.bot.trades[user_id]["users"]
-                self.bot.dispatch("trade", self.bot.trades[user_id])
-                await self.bot.redis.hdel("trade", a.id, b.id)
-                del self.bot.trades[a.id]
-                del self.bot.trades[b.id]
-            else:
-                await self.bot.redis.hdel("trade", user_id)
-            return True
-        else:
-            await self.bot.redis.rpush(f"cancel_trade:{cluster_id}", user_id)
-            return False
+        phase("check")
+
+        sides = [(a, b, list(trade[a.id])), (b, a, list(trade[b.id]))]
+
+        next_idxs = await asyncio.gather(
+            *(self.bot.mongo.fetch_next_idx(omem, len(pokemon)) for _, omem, pokemon in sides if len(pokemon) > 0)
+        )
+
+        phase("reserve")
+
+        requests = []
+        reverts = []
+        embeds = []
+        evolutions = []
+        next_idxs = iter(next_idxs)
+
+        for mem, omem, side in sides:
+            if len(side) == 0:
+                continue
+
+            idx = next(next_idxs)
+            for pokemon in side:
+                update = {"$set": {"owner_id": omem.id, "idx": idx}}
+                idx += 1
+
+                if pokemon.held_item != 13001:
+                    evos = [
+                        evo
+                        for evo in pokemon.species.trade_evolutions
+                        if (evo.trigger.item is None or evo.trigger.item.id == pokemon.held_item)
+                    ]
+
+                    if len(evos) > 0:
+                        evo = random.choice(evos)
+
+                        evo_embed = self.bot.Embed(title=f"Congratulations {omem.display_name}!")
+
+                        name = str(pokemon.species)
+
+                        if pokemon.nickname is not None:
+                            name += f' "{pokemon.nickname}"'
+
+                        evo_embed.add_field(
+                            name=f"The {name} is evolving!",
+                            value=f"The {name} has turned into a {evo.target}!",
+                        )
+
+                        update["$set"]["species_id"] = evo.target.id
+                        embeds.append(evo_embed)
+                        evolutions.append((mem, omem, pokemon, evo.target))
+
+                # Only pokemon the sender still owns are moved. Each write has a matching revert, which only matches
+                # if the write went through, for undoing a settlement that fails partway without a transaction.
+
+                requests.append(UpdateOne({"_id": pokemon.id, "owner_id": mem.id, "owned_by": "user"}, update))
+                reverts.append(
+                    UpdateOne(
+                        {"_id": pokemon.id, "owner_id": omem.id, "idx": update["$set"]["idx"]},
+                        {"$set": {"owner_id": mem.id, "idx": pokemon.idx, "species_id": pokemon.species_id}},
+                    )
+                )
+
+        # Each side's Pokécoins and redeems are taken in a single update that only matches if they can still be
+        # afforded, so nothing is overdrawn by a concurrent spend.
+
+        debits = []
+        for mem, omem, _ in sides:
+            inc = {k: v for k, v in (("balance", trade[mem.id].pokecoins), ("redeems", trade[mem.id].redeems)) if v > 0}
+            if len(inc) > 0:
+                debits.append((mem, omem, inc))
+
+        phase("plan")
+
+        applied = []
+        written = False
+        try:
+            async with self.bot.mongo.transaction() as session:
+                for mem, omem, inc in debits:
+                    result = await self.bot.mongo.db.member.update_one(
+                        {"_id": mem.id, **{k: {"$gte": v} for k, v in inc.items()}},
+                        {"$inc": {k: -v for k, v in inc.items()}},
+                        session=session,
+                    )
+                    if result.modified_count == 0:
+                        raise TradeFailed("one user does not have enough Pokécoins or redeems")
+                    applied.append((mem, inc))
+                    await self.bot.mongo.db.member.update_one({"_id": omem.id}, {"$inc": inc}, session=session)
+                    applied.append((omem, {k: -v for k, v in inc.items()}))
+
+                phase("currency")
+
+                written = True
+                if await self.bot.mongo.bulk_write_pokemon(requests, session=session) != len(requests):
+                    raise TradeFailed("some of the pokémon are no longer available")
+                phase("pokemon")
+        except Exception as e:
+            # A transaction has already been rolled back. Otherwise everything that was applied is undone here.
+
+            if not getattr(self.bot.config, "USE_TRANSACTIONS", False):
+                try:
+                    for mem, inc in applied:
+                        await self.bot.mongo.db.member.update_one({"_id": mem.id}, {"$inc": inc})
+                    if written:
+                        await self.bot.mongo.bulk_write_pokemon(reverts)
+                except Exception:
+                    self.bot.log.exception(f"Failed to undo trade between {a.id} and {b.id}")
+
+            if isinstance(e, TradeFailed):
+                await ctx.send(f"The trade could not be executed as {e}.")
+                return None
+            raise
+        finally:
+            await self.bot.mongo.invalidate_member(a.id, b.id)
+
+        for mem, omem, pokemon, target in evolutions:
+            self.bot.dispatch("evolve", mem, pokemon, target)
+            self.bot.dispatch("evolve", omem, pokemon, target)
+
+        self.bot.log.info("Trade executed", extra={"users": [a.id, b.id], "pokemon": len(requests), "timings": timings})
 
-    async def send_trade(self, ctx, user: discord.Member):
+        return embeds
+
+    async def send_trade(self, ctx, trade):
         # TODO this code is pretty shit. although it does work
 
-        trade = self.bot.trades[user.id]
-        a, b = trade["users"]
+        a, b = trade.users
 
         done = False
 
-        if trade[a.id] and trade[b.id] and not trade["executing"]:
+        if trade.confirmed and not trade.executing:
             done = True
-            trade["executing"] = True
+            trade.executing = True
+
+        if not await self.save_trade(trade):
+            if trade.revision == 0:
+                return await ctx.send("Sorry, one of you is already in another trade!")
+            return await ctx.send("The trade was changed at the same time. Please try again.")
 
-        num_pages = max(math.ceil(len(x) / 20) for x in trade["pokemon"].values())
+        num_pages = max(max(math.ceil(x.num_items / 20) for x in trade.sides.values()), 1)
 
         if done:
             execmsg = await ctx.send("Executing trade...")
 
-        users = {k: [("p", x) for x in v] for k, v in trade["pokemon"].items()}
-        for x in users:
-            if trade["redeems"][x] > 0:
-                users[x].insert(0, ("r", trade["redeems"][x]))
-            if trade["pokecoins"][x] > 0:
-                users[x].insert(0, ("c", trade["pokecoins"][x]))
-
-        embed_pages = list(zip_longest(*[list(chunks(x, 20)) for x in users.values()]))
-
-        if len(embed_pages) == 0:
-            embed_pages = [[[], []]]
-
         async def get_page(source, menu, pidx):
             embed = self.bot.Embed(title=f"Trade between {a.display_name} and {b.display_name}.")
 
             if done:
                 embed.title = f"✅ Completed trade between {a.display_name} and {b.display_name}."
 
-            for mem, page in zip((a, b), embed_pages[pidx]):
-                try:
-                    maxn = max(x.idx for t, x in page or [] if t == "p")
-                except ValueError:
-                    maxn = 0
+            for mem in (a, b):
+                side = trade[mem.id]
+                page = side.items(pidx * 20, pidx * 20 + 20)
+                maxn = max((x.idx for t, x in page if t == "p"), default=0)
 
                 def padn(idx, n):
                     return " " * (len(str(n)) - len(str(idx))) + str(idx)
@@ -139,16 +352,16 @@ class Trading(commands.Cog):
                     return val
 
                 val = "\n".join(
-                    f"{x:,} Pokécoins" if t == "c" else f"{x:,} redeems" if t == "r" else txt(x) for t, x in page or []
+                    f"{x:,} Pokécoins" if t == "c" else f"{x:,} redeems" if t == "r" else txt(x) for t, x in page
                 )
 
                 if val == "":
-                    if len(users[mem.id]) == 0:
+                    if side.num_items == 0:
                         val = "None"
                     else:
                         val = "None on this page"
 
-                sign = "🟢" if trade[mem.id] else "🔴"
+                sign = "🟢" if side.confirmed else "🔴"
 
                 embed.add_field(name=f"{sign} {mem.display_name}", value=val)
 
@@ -164,116 +377,15 @@ class Trading(commands.Cog):
 
         if done:
             try:
-                bothsides = list(enumerate(trade["pokemon"].items()))
-
-                for u in trade["users"]:
-                    member = await self.bot.mongo.fetch_member_info(u)
-                    if member.balance < trade["pokecoins"][u.id]:
-                        await ctx.send("The trade could not be executed as one user does not have enough Pokécoins.")
-                        await self.end_trade(a.id)
-                        return
-                    if member.redeems < trade["redeems"][u.id]:
-                        await ctx.send("The trade could not be executed as one user does not have enough redeems.")
-                        await self.end_trade(a.id)
-                        return
-
-                for idx, (i, side) in bothsides:
-                    _, (oi, _) = bothsides[(idx + 1) % 2]
-
-                    mem = ctx.guild.get_member(i) or await ctx.guild.fetch_member(i)
-                    omem = ctx.guild.get_member(oi) or await ctx.guild.fetch_member(oi)
-
-                    if trade["pokecoins"][i] > 0:
-                        res = await self.bot.mongo.db.member.find_one_and_update(
-                            {"_id": mem.id}, {"$inc": {"balance": -trade["pokecoins"][i]}}
-                        )
-                        await self.bot.redis.hdel("db:member", mem.id)
-                        if res["balance"] >= trade["pokecoins"][i]:
-                            await self.bot.mongo.update_member(omem, {"$inc": {"balance": trade["pokecoins"][i]}})
-                        else:
-                            await self.bot.mongo.update_member(mem, {"$inc": {"balance": trade["pokecoins"][i]}})
-                            return await ctx.send(
-                                "The trade could not be executed as one user does not have enough pokécoins."
-                            )
-
-                    if trade["redeems"][i] > 0:
-                        res = await self.bot.mongo.db.member.find_one_and_update(
-                            {"_id": mem.id}, {"$inc": {"redeems": -trade["redeems"][i]}}
-                        )
-                        await self.bot.redis.hdel("db:member", mem.id)
-                        if res["redeems"] >= trade["redeems"][i]:
-                            await self.bot.mongo.update_member(omem, {"$inc": {"redeems": trade["redeems"][i]}})
-                        else:
-                            await self.bot.mongo.update_member(mem, {"$inc": {"redeems": trade["redeems"][i]}})
-                            return await ctx.send(
-                                "The trade could not be executed as one user does not have enough redeems."
-                            )
-
-                for idx, (i, side) in bothsides:
-                    _, (oi, _) = bothsides[(idx + 1) % 2]
-
-                    mem = ctx.guild.get_member(i) or await ctx.guild.fetch_member(i)
-                    omem = ctx.guild.get_member(oi) or await ctx.guild.fetch_member(oi)
-
-                    idxs = set()
-
-                    num_pokes = len(list(x for x in side if type(x) != int))
-                    idx = await self.bot.mongo.fetch_next_idx(omem, num_pokes)
-
-                    for x in side:
-                        pokemon = x
-
-                        if pokemon.idx in idxs:
-                            continue
-
-                        idxs.add(pokemon.idx)
-
-                        update = {
-                            "$set": {
-                                "owner_id": omem.id,
-                                "idx": idx,
-                            }
-                        }
-                        idx += 1
-
-                        if pokemon.held_item != 13001:
-                            evos = [
-                                evo
-                                for evo in pokemon.species.trade_evolutions
-                                if (evo.trigger.item is None or evo.trigger.item.id == pokemon.held_item)
-                            ]
-
-                            if len(evos) > 0:
-                                evo = random.choice(evos)
-
-                                evo_embed = self.bot.Embed(title=f"Congratulations {omem.display_name}!")
-
-                                name = str(pokemon.species)
-
-                                if pokemon.nickname is not None:
-                                    name += f' "{pokemon.nickname}"'
-
-                                evo_embed.add_field(
-                                    name=f"The {name} is evolving!",
-                                    value=f"The {name} has turned into a {evo.target}!",
-                                )
-
-                                self.bot.dispatch("evolve", mem, pokemon, evo.target)
-                                self.bot.dispatch("evolve", omem, pokemon, evo.target)
-
-                                update["$set"]["species_id"] = evo.target.id
-
-                                embeds.append(evo_embed)
-
-                        await self.bot.mongo.update_pokemon(
-                            pokemon,
-                            update,
-                        )
-
+                embeds = await self.execute_trade(ctx, trade)
             except:
                 await self.end_trade(a.id)
                 raise
 
+            if embeds is None:
+                await self.end_trade(a.id)
+                return
+
             try:
                 await execmsg.delete()
             except:
@@ -285,16 +397,16 @@ class Trading(commands.Cog):
                         "event": "trade",
                         "users": [a.id, b.id],
                         "pokemon": {
-                            str(a.id): [x.id for x in trade["pokemon"][a.id]],
-                            str(b.id): [x.id for x in trade["pokemon"][b.id]],
+                            str(a.id): [x.id for x in trade[a.id]],
+                            str(b.id): [x.id for x in trade[b.id]],
                         },
                         "pokecoins": {
-                            str(a.id): trade["pokecoins"][a.id],
-                            str(b.id): trade["pokecoins"][b.id],
+                            str(a.id): trade[a.id].pokecoins,
+                            str(b.id): trade[b.id].pokecoins,
                         },
                         "redeems": {
-                            str(a.id): trade["redeems"][a.id],
-                            str(b.id): trade["redeems"][b.id],
+                            str(a.id): trade[a.id].redeems,
+                            str(b.id): trade[b.id].redeems,
                         },
                     }
                 )
@@ -308,11 +420,11 @@ class Trading(commands.Cog):
         pages = pagination.ContinuablePages(pagination.FunctionPageSource(num_pages, get_page))
         self.bot.menus[a.id] = pages
         self.bot.menus[b.id] = pages
-        if menu := trade.get("menu"):
+        if menu := trade.menu:
             menu.stop()
             await menu.message.delete()
         await pages.start(ctx)
-        trade["menu"] = pages
+        trade.menu = pages
 
         for evo_embed in embeds:
             await ctx.send(embed=evo_embed)
@@ -358,41 +470,23 @@ class Trading(commands.Cog):
         if await self.is_in_trade(user):
             return await ctx.send("Sorry, you can't accept a trade while you're already in one!")
 
-        trade = {
-            "pokemon": {ctx.author.id: [], user.id: []},
-            "redeems": {ctx.author.id: 0, user.id: 0},
-            "pokecoins": {ctx.author.id: 0, user.id: 0},
-            "users": [ctx.author, user],
-            ctx.author.id: False,
-            user.id: False,
-            "channel": ctx.channel,
-            "executing": False,
-            "last_updated": datetime.utcnow(),
-        }
-        self.bot.trades[ctx.author.id] = trade
-        self.bot.trades[user.id] = trade
-        await self.bot.redis.hset("trade", ctx.author.id, self.bot.cluster_idx)
-        await self.bot.redis.hset("trade", user.id, self.bot.cluster_idx)
-        await self.send_trade(ctx, ctx.author)
+        trade = Trade([ctx.author, user], ctx.channel)
+        await self.send_trade(ctx, trade)
 
     @commands.guild_only()
     @trade.command(aliases=("x",))
     async def cancel(self, ctx):
         """Cancel a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        try:
-            if self.bot.trades[ctx.author.id]["executing"]:
-                return await ctx.send("The trade is currently loading...")
-        except KeyError:
-            pass
+        if trade.executing:
+            return await ctx.send("The trade is currently loading...")
 
-        if await self.end_trade(ctx.author.id):
-            await ctx.send("The trade has been canceled.")
-        else:
-            await ctx.send("Attempting to cancel trade...")
+        await self.end_trade(ctx.author.id)
+        await ctx.send("The trade has been canceled.")
 
     @checks.has_started()
     @commands.guild_only()
@@ -400,19 +494,19 @@ class Trading(commands.Cog):
     async def confirm(self, ctx):
         """Confirm a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
-        last_updated = self.bot.trades[ctx.author.id]["last_updated"]
-        if datetime.utcnow() - last_updated < timedelta(seconds=3):
+        if datetime.utcnow() - trade.last_updated < timedelta(seconds=3):
             return await ctx.reply("The trade was recently modified. Please wait a few seconds, and then try again.")
 
-        self.bot.trades[ctx.author.id][ctx.author.id] = not self.bot.trades[ctx.author.id][ctx.author.id]
+        trade[ctx.author.id].confirmed = not trade[ctx.author.id].confirmed
 
-        await self.send_trade(ctx, ctx.author)
+        await self.send_trade(ctx, trade)
 
     @checks.has_started()
     @commands.max_concurrency(1, commands.BucketType.member)
@@ -421,13 +515,14 @@ class Trading(commands.Cog):
     async def add(self, ctx, *args):
         """Add pokémon to a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if ctx.channel.id != self.bot.trades[ctx.author.id]["channel"].id:
+        if ctx.channel.id != trade.channel.id:
             return await ctx.send("You must be in the same channel to add items!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
         if len(args) == 0:
@@ -444,23 +539,16 @@ class Trading(commands.Cog):
 
             for what in args:
                 if what.isdigit():
-                    skip = False
-
                     if not 1 <= int(what) <= 2 ** 31 - 1:
                         lines.append(f"{what}: NO")
                         continue
 
-                    for x in self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id]:
-                        if x.idx == int(what):
-                            lines.append(f"{what}: This pokémon is already in the trade!")
-                            skip = True
-                            break
-
-                    if skip:
+                    if trade[ctx.author.id].get(int(what)) is not None:
+                        lines.append(f"{what}: This pokémon is already in the trade!")
                         continue
 
                     number = int(what)
-                    member = await self.bot.mongo.fetch_member_info(ctx.author)
+                    member = await ctx.fetch_member_info()
                     pokemon = await self.bot.mongo.fetch_pokemon(ctx.author, number)
 
                     if pokemon is None:
@@ -475,7 +563,7 @@ class Trading(commands.Cog):
                         lines.append(f"{what}: You can't trade favorited pokémon!")
                         continue
 
-                    self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id].append(pokemon)
+                    trade[ctx.author.id].add(pokemon)
                     updated = True
                 else:
                     lines.append(f"{what}: That's not a valid item to add to the trade!")
@@ -487,12 +575,8 @@ class Trading(commands.Cog):
             if not updated:
                 return
 
-        for k in self.bot.trades[ctx.author.id]:
-            if type(k) == int:
-                self.bot.trades[ctx.author.id][k] = False
-
-        self.bot.trades[ctx.author.id]["last_updated"] = datetime.utcnow()
-        await self.send_trade(ctx, ctx.author)
+        trade.reset_confirmations()
+        await self.send_trade(ctx, trade)
 
     @checks.has_started()
     @commands.max_concurrency(1, commands.BucketType.member)
@@ -501,29 +585,28 @@ class Trading(commands.Cog):
     async def add_pokecoins(self, ctx, *, amt: int):
         """Add Pokécoin(s) to a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if ctx.channel.id != self.bot.trades[ctx.author.id]["channel"].id:
+        if ctx.channel.id != trade.channel.id:
             return await ctx.send("You must be in the same channel to add items!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
         if amt < 0:
             return await ctx.send("The amount must be positive!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
-        if self.bot.trades[ctx.author.id]["pokecoins"][ctx.author.id] + amt > member.balance:
+        member = await ctx.fetch_member_info()
+        if trade[ctx.author.id].pokecoins + amt > member.balance:
             return await ctx.send("You don't have enough pokécoins for that!")
 
-        self.bot.trades[ctx.author.id]["pokecoins"][ctx.author.id] += amt
+        trade[ctx.author.id].pokecoins += amt
 
-        for k in self.bot.trades[ctx.author.id]:
-            if type(k) == int:
-                self.bot.trades[ctx.author.id][k] = False
+        trade.reset_confirmations()
 
-        await self.send_trade(ctx, ctx.author)
+        await self.send_trade(ctx, trade)
 
     @checks.has_started()
     @commands.max_concurrency(1, commands.BucketType.member)
@@ -532,29 +615,28 @@ class Trading(commands.Cog):
     async def add_redeems(self, ctx, *, amt: int):
         """Add redeem(s) to a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if ctx.channel.id != self.bot.trades[ctx.author.id]["channel"].id:
+        if ctx.channel.id != trade.channel.id:
             return await ctx.send("You must be in the same channel to add items!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
         if amt < 0:
             return await ctx.send("The amount must be positive!")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
-        if self.bot.trades[ctx.author.id]["redeems"][ctx.author.id] + amt > member.redeems:
+        member = await ctx.fetch_member_info()
+        if trade[ctx.author.id].redeems + amt > member.redeems:
             return await ctx.send("You don't have enough redeems for that!")
 
-        self.bot.trades[ctx.author.id]["redeems"][ctx.author.id] += amt
+        trade[ctx.author.id].redeems += amt
 
-        for k in self.bot.trades[ctx.author.id]:
-            if type(k) == int:
-                self.bot.trades[ctx.author.id][k] = False
+        trade.reset_confirmations()
 
-        await self.send_trade(ctx, ctx.author)
+        await self.send_trade(ctx, trade)
 
     @checks.has_started()
     @commands.max_concurrency(1, commands.BucketType.member)
@@ -565,20 +647,19 @@ class Trading(commands.Cog):
 
         # TODO this shares a lot of code with the add command
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if ctx.channel.id != self.bot.trades[ctx.author.id]["channel"].id:
+        if ctx.channel.id != trade.channel.id:
             return await ctx.send("You must be in the same channel to remove items!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
         if len(args) == 0:
             return
 
-        trade = self.bot.trades[ctx.author.id]
-
         if len(args) <= 2 and args[-1].lower().endswith(("pp", "pc")):
             return await ctx.send(
                 f"`{ctx.prefix}trade remove <ids>` is now only for adding Pokémon. Please use the new `{ctx.prefix}trade remove pc <amount>` instead!"
@@ -587,11 +668,8 @@ class Trading(commands.Cog):
             updated = False
             for what in args:
                 if what.isdigit():
-                    for idx, x in enumerate(trade["pokemon"][ctx.author.id]):
-                        if x.idx == int(what):
-                            del trade["pokemon"][ctx.author.id][idx]
-                            updated = True
-                            break
+                    if trade[ctx.author.id].remove(int(what)) is not None:
+                        updated = True
                     else:
                         await ctx.send(f"{what}: Couldn't find that item!")
                 else:
@@ -601,11 +679,9 @@ class Trading(commands.Cog):
             if not updated:
                 return
 
-        for k in self.bot.trades[ctx.author.id]:
-            if type(k) == int:
-                self.bot.trades[ctx.author.id][k] = False
+        trade.reset_confirmations()
 
-        await self.send_trade(ctx, ctx.author)
+        await self.send_trade(ctx, trade)
 
     @checks.has_started()
     @commands.max_concurrency(1, commands.BucketType.member)
@@ -614,28 +690,27 @@ class Trading(commands.Cog):
     async def remove_pokecoins(self, ctx, *, amt: int):
         """Remove Pokécoin(s) from a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if ctx.channel.id != self.bot.trades[ctx.author.id]["channel"].id:
+        if ctx.channel.id != trade.channel.id:
             return await ctx.send("You must be in the same channel to add items!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
         if amt < 0:
             return await ctx.send("The amount must be positive!")
 
-        if self.bot.trades[ctx.author.id]["pokecoins"][ctx.author.id] - amt < 0:
+        if trade[ctx.author.id].pokecoins - amt < 0:
             return await ctx.send("There aren't that many pokécoins in the trade!")
 
-        self.bot.trades[ctx.author.id]["pokecoins"][ctx.author.id] -= amt
+        trade[ctx.author.id].pokecoins -= amt
 
-        for k in self.bot.trades[ctx.author.id]:
-            if type(k) == int:
-                self.bot.trades[ctx.author.id][k] = False
+        trade.reset_confirmations()
 
-        await self.send_trade(ctx, ctx.author)
+        await self.send_trade(ctx, trade)
 
     @checks.has_started()
     @commands.max_concurrency(1, commands.BucketType.member)
@@ -644,28 +719,27 @@ class Trading(commands.Cog):
     async def remove_redeems(self, ctx, *, amt: int):
         """Remove redeem(s) from a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if ctx.channel.id != self.bot.trades[ctx.author.id]["channel"].id:
+        if ctx.channel.id != trade.channel.id:
             return await ctx.send("You must be in the same channel to add items!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
         if amt < 0:
             return await ctx.send("The amount must be positive!")
 
-        if self.bot.trades[ctx.author.id]["redeems"][ctx.author.id] - amt < 0:
+        if trade[ctx.author.id].redeems - amt < 0:
             return await ctx.send("There aren't that many redeems in the trade!")
 
-        self.bot.trades[ctx.author.id]["redeems"][ctx.author.id] -= amt
+        trade[ctx.author.id].redeems -= amt
 
-        for k in self.bot.trades[ctx.author.id]:
-            if type(k) == int:
-                self.bot.trades[ctx.author.id][k] = False
+        trade.reset_confirmations()
 
-        await self.send_trade(ctx, ctx.author)
+        await self.send_trade(ctx, trade)
 
     # Filter
     @flags.add_flag("page", nargs="?", type=int, default=1)
@@ -713,16 +787,17 @@ class Trading(commands.Cog):
     async def addall(self, ctx, **flags):
         """Add multiple pokémon to a trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        if ctx.channel.id != self.bot.trades[ctx.author.id]["channel"].id:
+        if ctx.channel.id != trade.channel.id:
             return await ctx.send("You must be in the same channel to add items!")
 
-        if self.bot.trades[ctx.author.id]["executing"]:
+        if trade.executing:
             return await ctx.send("The trade is currently loading...")
 
-        member = await self.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         aggregations = await self.bot.get_cog("Pokemon").create_filter(flags, ctx, order_by=member.order_by)
 
@@ -736,15 +811,26 @@ class Trading(commands.Cog):
             ]
         )
 
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        trade_size = len(trade[ctx.author.id])
+
+        # Count and fetch in one pass, fetching no more than would fit in the trade
+
+        result = await self.bot.mongo.fetch_pokemon_facets(
+            ctx.author,
+            aggregations,
+            {
+                "count": [{"$count": "num_matches"}],
+                "pokemon": [{"$limit": max(3000 - trade_size, 0) + 1}],
+            },
+        )
+        num = result["count"][0]["num_matches"] if len(result["count"]) > 0 else 0
+        pokemon = [self.bot.mongo.Pokemon.build_from_mongo(x) for x in result["pokemon"]]
 
         if num == 0:
             return await ctx.send("Found no pokémon matching this search (excluding favorited and selected pokémon).")
 
         # confirm
 
-        trade_size = len(self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id])
-
         if 3000 - trade_size < 0:
             return await ctx.send(
                 f"There are too many pokémon in this trade! Try adding them individually or seperating it into different trades."
@@ -767,23 +853,13 @@ class Trading(commands.Cog):
 
         await ctx.send(f"Adding {num} pokémon, this might take a while...")
 
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
-        self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id].extend(
-            [
-                x
-                async for x in pokemon
-                if all(
-                    (type(i) == int or x.idx != i.idx for i in self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id])
-                )
-            ]
-        )
+        side = trade[ctx.author.id]
+        for x in pokemon:
+            side.add(x)
 
-        for k in self.bot.trades[ctx.author.id]:
-            if type(k) == int:
-                self.bot.trades[ctx.author.id][k] = False
+        trade.reset_confirmations()
 
-        await self.send_trade(ctx, ctx.author)
+        await self.send_trade(ctx, trade)
 
     @checks.has_started()
     @commands.guild_only()
@@ -791,17 +867,15 @@ class Trading(commands.Cog):
     async def info(self, ctx, *, number: int):
         """View a pokémon from the trade."""
 
-        if not await self.is_in_trade(ctx.author):
+        trade = await self.fetch_trade(ctx.author.id)
+        if trade is None:
             return await ctx.send("You're not in a trade!")
 
-        other_id = next(x for x in self.bot.trades[ctx.author.id] if type(x) == int and x != ctx.author.id)
-        other = ctx.guild.get_member(other_id) or await ctx.guild.fetch_member(other_id)
+        side = trade.other(ctx.author.id)
+        other = side.user
 
-        try:
-            pokemon = next(
-                x for x in self.bot.trades[ctx.author.id]["pokemon"][other_id] if type(x) != int and x.idx == number
-            )
-        except StopIteration:
+        pokemon = side.get(number)
+        if pokemon is None:
             return await ctx.send("Couldn't find that pokémon in the trade!")
 
         embed = self.bot.Embed(title=f"{pokemon:ln}")
@@ -844,7 +918,7 @@ class Trading(commands.Cog):
         await ctx.send(embed=embed)
 
     def cog_unload(self):
-        self.process_cancel_trades.cancel()
+        self._listen_task.cancel()
 
 
 async def setup(bot: commands.Bot):
@@ -18,7 +18,7 @@ class Valentines(commands.Cog):
 
     @commands.group(aliases=("event", "valentines"), invoke_without_command=True)
     async def valentine(self, ctx):
-        author_data = await self.bot.mongo.fetch_member_info(ctx.author)
+        author_data = await ctx.fetch_member_info()
         species = self.bot.data.species_by_number(50058)
         embed = discord.Embed(
             title="Valentine's Day 2022 \N{HEART WITH RIBBON}",
@@ -47,7 +47,7 @@ class Valentines(commands.Cog):
         if user == ctx.author:
             return await ctx.send("You cannot gift yourself!")
 
-        author_data = await self.bot.mongo.fetch_member_info(ctx.author)
+        author_data = await ctx.fetch_member_info()
         user_data = await self.bot.mongo.fetch_member_info(user)
 
         # Checks
@@ -81,12 +81,12 @@ class Valentines(commands.Cog):
 
         ivs = [mongo.random_iv() for i in range(6)]
 
-        author_data = await self.bot.mongo.fetch_member_info(ctx.author)
+        author_data = await ctx.fetch_member_info()
         if author_data.balance < price:
             return await ctx.send("You don't have enough Pokécoins for that!")
         if author_data.valentines_purchased >= 5:
             return await ctx.send("You have already purchased the maximum number of gifts!")
-        await self.bot.mongo.update_member(ctx.author, {"$inc": {"balance": -price, "valentines_purchased": 1}})
+        await ctx.update_member({"$inc": {"balance": -price, "valentines_purchased": 1}})
 
         await self.bot.mongo.db.pokemon.insert_one(
             {
@@ -6,6 +6,71 @@ DATABASE_NAME = None
 BOT_TOKEN = None
 REDIS_CONF = {}
 
+# Member cache
+MEMBER_CACHE_SIZE = 10000
+MEMBER_CACHE_TTL = 300
+MEMBER_REDIS_TTL = 3600
+# Honor outside services that still invalidate members with HDEL db:member <id>
+MEMBER_LEGACY_INVALIDATION = True
+
+# Guild cache
+GUILD_CACHE_SIZE = 100000
+GUILD_CACHE_TTL = 3600
+
+# Prefix cache
+PREFIX_CACHE_SIZE = 100000
+PREFIX_CACHE_TTL = 86400
+
+# Spawn and XP rate limiting
+COOLDOWN_GENERATION_PERIOD = 60
+GUILD_COUNTER_GENERATION_PERIOD = 3600
+
+# Spawn image cache (SPAWN_IMAGE_CACHE_DIR keeps images from SERVER_URL on disk across restarts)
+SPAWN_IMAGE_CACHE_BYTES = 128 * 1024 * 1024
+SPAWN_IMAGE_CACHE_DIR = None
+
+# Auction settlement
+AUCTION_SETTLE_CONCURRENCY = 8
+AUCTION_CLAIM_LEASE = 120
+AUCTION_MAX_RETRY_DELAY = 600
+
+# Vote reminders
+VOTE_REMINDER_BATCH_SIZE = 50
+VOTE_REMINDER_DM_RATE = 5
+
+# Cross-cluster messages waiting for a cluster, by count and seconds since the last one was sent
+RPC_MAX_BACKLOG = 10000
+RPC_BACKLOG_TTL = 300
+# Drain the old send_dm list of pickled (user id, content) tuples into the DM queue
+LEGACY_SEND_DM = True
+
+# Trade sessions, in seconds since the last change
+TRADE_SESSION_TTL = 3600
+# How long an executing trade is held, in case the cluster settling it goes away
+TRADE_EXECUTE_LEASE = 300
+
+# DM dispatch
+DM_CHANNEL_CACHE_SIZE = 100000
+DM_CHANNEL_CACHE_TTL = 86400
+DM_CHANNEL_REDIS_TTL = 604800
+DM_QUEUE_SIZE = 10000
+DM_WORKERS = 4
+DM_RATE = 10
+DM_DRAIN_TIMEOUT = 5
+
+# XP buffering
+XP_FLUSH_INTERVAL = 30
+XP_FLUSH_BATCH_SIZE = 1000
+
+# Create missing indexes on startup. Can be slow on large collections, see the admin indexes command instead.
+ENSURE_INDEXES = False
+
+# Mass pokemon updates
+BULK_UPDATE_CHUNK_SIZE = 5000
+
+# Apply multi-document writes such as trades in a transaction (requires a replica set)
+USE_TRANSACTIONS = False
+
 # DBL
 DBL_TOKEN = None
 DBL_SECRET = None
@@ -27,7 +27,7 @@ def is_admin():
 
 def has_started():
     async def predicate(ctx):
-        member = await ctx.bot.mongo.Member.find_one({"id": ctx.author.id}, {"suspended": 1, "suspension_reason": 1})
+        member = await ctx.fetch_member_info()
         if member is None:
             raise NotStarted(f"Please pick a starter pokémon by typing `{ctx.prefix}start` before using this command!")
         return True
@@ -46,9 +46,7 @@ def is_not_in_trade():
 
 def general_check():
     async def predicate(ctx):
-        member = await ctx.bot.mongo.Member.find_one(
-            {"id": ctx.author.id}, {"suspended": 1, "suspension_reason": 1, "tos": 1}
-        )
+        member = await ctx.fetch_member_info()
         if member is None:
             return True
 
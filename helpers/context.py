@@ -1,5 +1,6 @@
 import discord
 from discord.ext import commands
+from discord.utils import MISSING
 
 
 class ConfirmationView(discord.ui.View):
@@ -41,6 +42,28 @@ class ConfirmationView(discord.ui.View):
 
 
 class PoketwoContext(commands.Context):
+    _member_info = MISSING
+    _member_token = None
+
+    async def fetch_member_info(self):
+        # Checks, converters and the command body all share one member read per invocation. The snapshot is dropped
+        # if the Mongo cog invalidates the author, so writes that don't go through ctx.update_member are seen too.
+
+        invalidations = self.bot.mongo.member_invalidations
+        if self._member_info is MISSING or invalidations.changed(self.author.id, self._member_token):
+            token = invalidations.token()
+            self._member_info = await self.bot.mongo.fetch_member_info(self.author)
+            self._member_token = token
+        return self._member_info
+
+    def invalidate_member_info(self):
+        self._member_info = MISSING
+
+    async def update_member(self, update):
+        result = await self.bot.mongo.update_member(self.author, update)
+        self.invalidate_member_info()
+        return result
+
     async def confirm(self, message=None, *, embed=None, timeout=40, cls=ConfirmationView):
         view = cls(self, timeout=timeout)
         view.message = await self.send(
@@ -50,4 +73,8 @@ class PoketwoContext(commands.Context):
             allowed_mentions=discord.AllowedMentions.none(),
         )
         await view.wait()
+
+        # Anything could have changed while waiting on the user
+        self.invalidate_member_info()
+
         return view.result
@@ -41,7 +41,7 @@ class PokemonConverter(commands.Converter):
     async def convert(self, ctx, arg):
         arg = arg.strip()
 
-        member = await ctx.bot.mongo.fetch_member_info(ctx.author)
+        member = await ctx.fetch_member_info()
 
         if arg == "" and self.accept_blank:
             number = member.selected_id
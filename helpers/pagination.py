@@ -75,6 +75,109 @@ class AsyncListPageSource(menus.AsyncIteratorPageSource):
         return embed
 
 
+def get_field(item, path):
+    if hasattr(item, "to_mongo"):
+        item = item.to_mongo()
+    for x in path.split("."):
+        item = item.get(x) if item is not None else None
+    return item
+
+
+class KeysetPageSource(AsyncListPageSource):
+    """Random-access page source that seeks on the sort key (with _id as a tiebreaker) instead of iterating a cursor
+    from the start. The keys at each page boundary seen so far are remembered, so moving to a neighboring page is an
+    index seek, and other pages are reached by skipping from whichever known page or end of the list is closest."""
+
+    def __init__(self, fetch, aggregations, count, prefetched=None, **kwargs):
+        super().__init__(None, count=count, **kwargs)
+        self.fetch = fetch
+        self.filters = aggregations[:-1]
+        ((self.key, self.direction),) = aggregations[-1]["$sort"].items()
+        self.bounds = {}
+        self.prefetched = dict(prefetched or {})
+
+    @staticmethod
+    def can_seek(aggregations):
+        return (
+            len(aggregations) > 0
+            and all(next(iter(x)) == "$match" for x in aggregations[:-1])
+            and next(iter(aggregations[-1])) == "$sort"
+            and len(aggregations[-1]["$sort"]) == 1
+        )
+
+    @staticmethod
+    def tiebroken(aggregations):
+        # The order pages are fetched in, for pages fetched up front by the caller
+
+        ((key, direction),) = aggregations[-1]["$sort"].items()
+        if key == "_id":
+            return aggregations
+        return [*aggregations[:-1], {"$sort": {key: direction, "_id": direction}}]
+
+    async def prepare(self):
+        pass
+
+    def is_paginating(self):
+        return self.count > self.per_page
+
+    def seek(self, bound, forward):
+        op = "$gt" if (self.direction == 1) == forward else "$lt"
+        value, id = bound
+        if self.key == "_id":
+            return [{"$match": {"_id": {op: id}}}]
+        return [{"$match": {"$or": [{self.key: {op: value}}, {self.key: value, "_id": {op: id}}]}}]
+
+    async def get_page(self, page_number):
+        start = page_number * self.per_page
+        size = min(self.per_page, self.count - start)
+        if page_number < 0 or size <= 0:
+            raise IndexError
+
+        if page_number in self.prefetched:
+            entries = self.prefetched.pop(page_number)
+            if len(entries) == 0:
+                raise IndexError
+            self.bounds[page_number] = tuple(
+                (get_field(x, self.key), get_field(x, "_id")) for x in (entries[0], entries[-1])
+            )
+            return entries
+
+        # Each candidate is (rows to skip, seek stages, forward)
+
+        candidates = [(start, [], True), (self.count - start - size, [], False)]
+        for page, (first, last) in self.bounds.items():
+            if page < page_number:
+                candidates.append(((page_number - page - 1) * self.per_page, self.seek(last, True), True))
+            elif page > page_number:
+                candidates.append(((page - page_number - 1) * self.per_page, self.seek(first, False), False))
+        skip, seek, forward = min(candidates, key=lambda x: x[0])
+
+        direction = self.direction if forward else -self.direction
+        aggregations = [
+            *self.filters,
+            *seek,
+            {"$sort": {self.key: direction, "_id": direction}},
+            *([{"$skip": skip}] if skip > 0 else []),
+            {"$limit": size},
+        ]
+        entries = [x async for x in self.fetch(aggregations)]
+        if not forward:
+            entries.reverse()
+        if len(entries) == 0:
+            raise IndexError
+
+        self.bounds[page_number] = tuple(
+            (get_field(x, self.key), get_field(x, "_id")) for x in (entries[0], entries[-1])
+        )
+        return entries
+
+
+def make_list_page_source(fetch, aggregations, count, prefetched=None, **kwargs):
+    if KeysetPageSource.can_seek(aggregations):
+        return KeysetPageSource(fetch, aggregations, count, prefetched=prefetched, **kwargs)
+    return AsyncListPageSource(fetch(aggregations), count=count, **kwargs)
+
+
 class ContinuablePages(ViewMenuPages):
     def __init__(self, source, allow_last=True, allow_go=True, **kwargs):
         super().__init__(source, **kwargs, timeout=120)
@@ -0,0 +1,95 @@
+import itertools
+
+# An empty $in on _id is answered straight from the _id index without examining any documents
+
+EMPTY_QUERY = {"_id": {"$in": []}}
+
+
+class QueryBuilder:
+    """Collects the conditions of a search into a single query document. Species restrictions are intersected in
+    Python, bounds on the same field are merged, and conditions that can never all hold mark the query as empty."""
+
+    def __init__(self):
+        self.species = {}
+        self.values = {}
+        self.bounds = {}
+        self.clauses = []
+        self.empty = False
+
+    def restrict(self, field, ids):
+        ids = set(ids)
+        if field in self.species:
+            ids &= self.species[field]
+        self.species[field] = ids
+        if len(ids) == 0:
+            self.empty = True
+
+    def equals(self, field, value):
+        if field in self.values and self.values[field] != value:
+            self.empty = True
+        self.values[field] = value
+        if not self.satisfiable(field, value):
+            self.empty = True
+
+    def less_than(self, field, value):
+        lo, hi = self.bounds.get(field, (None, None))
+        hi = value if hi is None else min(hi, value)
+        self.set_bounds(field, lo, hi)
+
+    def greater_than(self, field, value):
+        lo, hi = self.bounds.get(field, (None, None))
+        lo = value if lo is None else max(lo, value)
+        self.set_bounds(field, lo, hi)
+
+    def set_bounds(self, field, lo, hi):
+        self.bounds[field] = (lo, hi)
+        if lo is not None and hi is not None:
+            # Every numeric field we filter on holds integers, so there is nothing strictly between n and n + 1
+            gap = 1 if isinstance(lo, int) and isinstance(hi, int) else 0
+            if hi - lo <= gap:
+                self.empty = True
+        if field in self.values and not self.satisfiable(field, self.values[field]):
+            self.empty = True
+
+    def satisfiable(self, field, value):
+        if field in self.values and self.values[field] != value:
+            return False
+        lo, hi = self.bounds.get(field, (None, None))
+        return (lo is None or value > lo) and (hi is None or value < hi)
+
+    def any_equal(self, fields, value, amount):
+        # At least `amount` of the fields equal value. Combinations ruled out by the other conditions are dropped,
+        # and if only one is left its fields are plain equalities rather than a single-branch $or.
+
+        combinations = [
+            combo for combo in itertools.combinations(fields, amount) if all(self.satisfiable(x, value) for x in combo)
+        ]
+        if len(combinations) == 0:
+            self.empty = True
+        elif len(combinations) == 1:
+            for field in combinations[0]:
+                self.equals(field, value)
+        else:
+            self.clauses.append({"$or": [{field: value for field in combo} for combo in combinations]})
+
+    def add(self, clause):
+        self.clauses.append(clause)
+
+    def build(self):
+        if self.empty:
+            return EMPTY_QUERY
+
+        query = {}
+        for field, ids in self.species.items():
+            query[field] = {"$in": sorted(ids)}
+        for field, (lo, hi) in self.bounds.items():
+            if field not in self.values:
+                query[field] = {
+                    **({"$gt": lo} if lo is not None else {}),
+                    **({"$lt": hi} if hi is not None else {}),
+                }
+        query.update(self.values)
+        if len(self.clauses) > 0:
+            query["$and"] = self.clauses
+
+        return query
@@ -0,0 +1,140 @@
+from datetime import datetime
+from itertools import islice
+
+import bson
+
+# Bumped whenever the serialized form of a trade changes, so older sessions can be told apart
+
+FORMAT_VERSION = 1
+
+
+class TradeSide:
+    """What one user is putting into a trade. Pokemon are kept in the order they were added, keyed by _id, with a
+    second index by idx, so adding, removing and looking up a pokemon doesn't depend on how many are in the trade."""
+
+    __slots__ = ("user", "pokemon", "by_idx", "pokecoins", "redeems", "confirmed")
+
+    def __init__(self, user):
+        self.user = user
+        self.pokemon = {}
+        self.by_idx = {}
+        self.pokecoins = 0
+        self.redeems = 0
+        self.confirmed = False
+
+    def __len__(self):
+        return len(self.pokemon)
+
+    def __iter__(self):
+        return iter(self.pokemon.values())
+
+    def __contains__(self, pokemon):
+        return pokemon.id in self.pokemon or pokemon.idx in self.by_idx
+
+    def add(self, pokemon):
+        # Returns whether the pokemon was added, i.e. wasn't already in the trade
+
+        if pokemon in self:
+            return False
+        self.pokemon[pokemon.id] = pokemon
+        self.by_idx[pokemon.idx] = pokemon.id
+        return True
+
+    def get(self, idx):
+        if (id := self.by_idx.get(idx)) is not None:
+            return self.pokemon[id]
+
+    def remove(self, idx):
+        if (id := self.by_idx.pop(idx, None)) is not None:
+            return self.pokemon.pop(id)
+
+    @property
+    def num_items(self):
+        return (self.pokecoins > 0) + (self.redeems > 0) + len(self.pokemon)
+
+    def items(self, start, stop):
+        # The embed lines from start to stop, as ("c", pokecoins), ("r", redeems) or ("p", pokemon). Only the
+        # requested slice is built, so showing a page doesn't touch the rest of the trade.
+
+        currency = [("c", self.pokecoins)] if self.pokecoins > 0 else []
+        if self.redeems > 0:
+            currency.append(("r", self.redeems))
+
+        head = currency[start:stop]
+        start, stop = max(start - len(currency), 0), max(stop - len(currency), 0)
+        return head + [("p", x) for x in islice(self.pokemon.values(), start, stop)]
+
+
+class Trade:
+    """A trade between two users, with each side's offer looked up by user ID. The revision counts the saved changes
+    to the trade, so a save based on an outdated copy can be detected."""
+
+    __slots__ = ("id", "revision", "users", "sides", "channel", "executing", "last_updated", "menu")
+
+    def __init__(self, users, channel, id=None):
+        self.id = id or str(bson.ObjectId())
+        self.revision = 0
+        self.users = users
+        self.sides = {x.id: TradeSide(x) for x in users}
+        self.channel = channel
+        self.executing = False
+        self.last_updated = datetime.utcnow()
+        self.menu = None
+
+    def __getitem__(self, user_id):
+        return self.sides[user_id]
+
+    def other(self, user_id):
+        return next(side for id, side in self.sides.items() if id != user_id)
+
+    @property
+    def confirmed(self):
+        return all(x.confirmed for x in self.sides.values())
+
+    def reset_confirmations(self):
+        for side in self.sides.values():
+            side.confirmed = False
+
+    def serialize(self):
+        # Pokemon are stored by _id only, since their documents can be fetched again wherever the trade is loaded
+
+        return bson.encode(
+            {
+                "format": FORMAT_VERSION,
+                "channel": self.channel.id,
+                "executing": self.executing,
+                "last_updated": self.last_updated,
+                "sides": [
+                    {
+                        "user": side.user.id,
+                        "pokemon": list(side.pokemon),
+                        "pokecoins": side.pokecoins,
+                        "redeems": side.redeems,
+                        "confirmed": side.confirmed,
+                    }
+                    for side in self.sides.values()
+                ],
+            }
+        )
+
+    @classmethod
+    def deserialize(cls, id, revision, data, users, channel, pokemon):
+        # users maps user IDs to users and pokemon maps _ids to pokemon. Pokemon that no longer exist are dropped.
+
+        doc = bson.decode(data) if isinstance(data, bytes) else data
+        if doc.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported trade format {doc.get('format')}")
+
+        trade = cls([users[x["user"]] for x in doc["sides"]], channel, id=id)
+        trade.revision = revision
+        trade.executing = doc["executing"]
+        trade.last_updated = doc["last_updated"]
+        for x in doc["sides"]:
+            side = trade[x["user"]]
+            side.pokecoins = x["pokecoins"]
+            side.redeems = x["redeems"]
+            side.confirmed = x["confirmed"]
+            for id in x["pokemon"]:
+                if id in pokemon:
+                    side.add(pokemon[id])
+        return trade
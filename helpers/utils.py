@@ -1,4 +1,9 @@
+import sys
+import time
+from collections import OrderedDict
+
 import discord
+from discord.utils import MISSING
 
 from dataclasses import dataclass
 
@@ -32,3 +37,105 @@ class FakeUser(discord.Object):
 
     async def remove_roles(self, *args, **kwargs):
         pass
+
+
+def could_be_command(content, prefixes, commands):
+    # Mirrors how the command framework finds the invoked command: a prefix, then everything up to the first
+    # whitespace. If this returns False the message can't invoke anything; True only means it might.
+
+    for prefix in prefixes:
+        if content.startswith(prefix):
+            rest = content[len(prefix) :]
+            invoker = rest.split(None, 1)[0] if rest[:1].strip() else ""
+            if invoker in commands:
+                return True
+    return False
+
+
+class GenerationalDict:
+    """Mapping whose keys are dropped after going unused for between one and two periods. Writes and reads go to the
+    current generation, and once a period has passed the previous generation is discarded as a whole, so nothing is
+    tracked or scanned per key."""
+
+    __slots__ = ("period", "current", "previous", "rotated_at")
+
+    def __init__(self, period):
+        self.period = period
+        self.current = {}
+        self.previous = {}
+        self.rotated_at = time.monotonic()
+
+    def rotate(self):
+        now = time.monotonic()
+        if now - self.rotated_at >= self.period:
+            self.previous = self.current if now - self.rotated_at < 2 * self.period else {}
+            self.current = {}
+            self.rotated_at = now
+
+    def get(self, key, default=None):
+        self.rotate()
+        if key in self.current:
+            return self.current[key]
+        if key in self.previous:
+            value = self.current[key] = self.previous.pop(key)
+            return value
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.rotate()
+        self.previous.pop(key, None)
+        self.current[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
+
+    def memory_usage(self):
+        return sum(
+            sys.getsizeof(x) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in x.items())
+            for x in (self.current, self.previous)
+        )
+
+
+class InvalidationTracker:
+    """Records when each key was last invalidated, so a cache fill can tell whether its own key was invalidated while
+    the read was in flight. Only the most recent invalidations are kept; older ones are folded into a floor, which
+    errs on the side of not storing."""
+
+    __slots__ = ("max_len", "seq", "floor", "last")
+
+    def __init__(self, max_len=10000):
+        self.max_len = max_len
+        self.seq = 0
+        self.floor = 0
+        self.last = OrderedDict()
+
+    def token(self):
+        # Taken before a read and passed to changed afterwards
+        return self.seq
+
+    def invalidate(self, *keys):
+        self.seq += 1
+        for key in keys:
+            self.last[key] = self.seq
+            self.last.move_to_end(key)
+        while len(self.last) > self.max_len:
+            _, seq = self.last.popitem(last=False)
+            self.floor = max(self.floor, seq)
+
+    def reset(self):
+        # Treats every key as invalidated
+        self.seq += 1
+        self.floor = self.seq
+        self.last.clear()
+
+    def changed(self, key, token):
+        return self.last.get(key, self.floor) > token
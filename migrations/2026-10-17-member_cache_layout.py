@@ -0,0 +1,60 @@
+"""
+This is a one-shot script used to move the member cache from the single db:member hash of pickled documents to one
+expiring db:member:<id> key per member, and to compare the memory used by both layouts. With
+MEMBER_LEGACY_INVALIDATION on, db:member is kept with a marker per migrated member instead of being deleted.
+17 October 2026
+"""
+
+import asyncio
+import pickle
+
+import aioredis
+
+import config
+from cogs.mongo import encode_cached_member
+
+TTL = getattr(config, "MEMBER_REDIS_TTL", 3600)
+LEGACY = getattr(config, "MEMBER_LEGACY_INVALIDATION", True)
+
+
+async def main():
+    redis = await aioredis.create_redis_pool(**config.REDIS_CONF)
+
+    old_usage = await redis.execute("MEMORY", "USAGE", "db:member", "SAMPLES", "0") or 0
+    old_bytes = new_bytes = count = 0
+    new_usage = 0
+
+    cur = None
+    while cur != 0:
+        cur, entries = await redis.hscan("db:member", cur or 0, count=1000)
+        tr = redis.multi_exec()
+        for id, val in entries:
+            doc = None if len(val) == 0 else pickle.loads(val)
+            data = encode_cached_member(doc)
+            old_bytes += len(val)
+            new_bytes += len(data)
+            count += 1
+            tr.set(f"db:member:{int(id)}", data, expire=TTL)
+        await tr.execute()
+
+        for id, val in entries:
+            new_usage += await redis.execute("MEMORY", "USAGE", f"db:member:{int(id)}") or 0
+
+    print(f"Migrated {count} members")
+    print(f"Serialized payload: {old_bytes} bytes (pickle) -> {new_bytes} bytes (bson)")
+    print(f"Redis memory usage: {old_usage} bytes (db:member) -> {new_usage} bytes (db:member:*)")
+
+    if LEGACY:
+        cur = None
+        while cur != 0:
+            cur, entries = await redis.hscan("db:member", cur or 0, count=1000)
+            if len(entries) > 0:
+                await redis.hmset_dict("db:member", {id: 1 for id, _ in entries})
+    else:
+        await redis.delete("db:member")
+
+    redis.close()
+    await redis.wait_closed()
+
+
+asyncio.get_event_loop().run_until_complete(main())